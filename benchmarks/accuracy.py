@@ -0,0 +1,163 @@
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from governor import QueryGovernor
+from runner import open_copy
+from sql_tokens import tokenize
+
+GOLD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gold_sql.json")
+# Floats are compared after rounding to this many decimal places.
+FLOAT_DIGITS = 6
+# Column mappings tried when the prediction returns extra columns.
+MAX_PROJECTIONS = 1000
+
+# Runaway predictions are cut off rather than holding up a worker.
+_governor = QueryGovernor(max_seconds=10, max_rows=1_000_000)
+_db = None
+_image = None
+
+
+def load_gold(path=GOLD_PATH):
+    # question -> gold SQL, or None for questions too ambiguous to score
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_ordered(sql):
+    # Row order only matters when the outermost query has an ORDER BY.
+    depth = 0
+    tokens = list(tokenize(sql))
+    for i, (kind, text) in enumerate(tokens):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text.upper() == "ORDER" and i + 1 < len(tokens) and tokens[i + 1][1].upper() == "BY":
+            return True
+    return False
+
+
+def _normalize(value):
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return str(value)
+        value = round(value, FLOAT_DIGITS)
+        # 2.0 and 2 are the same answer
+        return int(value) if value.is_integer() else value
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def _sort_key(value):
+    # Orders mixed types the way SQLite does: NULL, numbers, text, blobs.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+def normalize_rows(rows, ordered):
+    rows = [tuple(_normalize(v) for v in row) for row in rows]
+    if not ordered:
+        rows.sort(key=lambda row: tuple(_sort_key(v) for v in row))
+    return rows
+
+
+def result_hash(rows):
+    # `rows` as returned by normalize_rows
+    return hashlib.sha1(json.dumps(rows, default=str).encode()).hexdigest()
+
+
+def _projection_matches(gold, pred, ordered):
+    # True if some choice of distinct prediction columns reproduces the gold
+    # result, so `SELECT *` still matches a gold query naming one column.
+    if len(gold) != len(pred):
+        return False
+    if not gold:
+        return True
+    gold_cols = list(zip(*gold))
+    pred_cols = list(zip(*pred))
+    if len(pred_cols) < len(gold_cols):
+        return False
+
+    def signature(col):
+        return col if ordered else sorted(col, key=_sort_key)
+
+    pred_signatures = [signature(col) for col in pred_cols]
+    candidates = [
+        [j for j, sig in enumerate(pred_signatures) if sig == signature(col)]
+        for col in gold_cols
+    ]
+    if not all(candidates):
+        return False
+    for choice in itertools.islice(itertools.product(*candidates), MAX_PROJECTIONS):
+        if len(set(choice)) != len(choice):
+            continue
+        projected = normalize_rows([tuple(row[j] for j in choice) for row in pred], ordered)
+        if projected == gold:
+            return True
+    return False
+
+
+def _init_worker(image):
+    global _db, _image
+    _db = open_copy(image)
+    _image = image
+
+
+def _run(sql):
+    with _governor.guard(_db) as budget:
+        rows = _db.execute(sql).fetchall()
+        budget.add_result(len(rows), 0)
+    return rows
+
+
+def evaluate_one(item):
+    # item is (question, gold SQL, predicted SQL); runs in a worker process.
+    question, gold_sql, pred_sql = item
+    result = {"question": question, "correct": None, "gold_hash": None, "pred_hash": None, "error": None}
+    if gold_sql is None:
+        return result
+    # Predicted SQL may write or drop tables, so every item starts from a
+    # fresh copy and the score doesn't depend on what ran before it
+    _db.deserialize(_image)
+    ordered = is_ordered(gold_sql)
+    try:
+        gold = normalize_rows(_run(gold_sql), ordered)
+    except Exception as e:
+        result["error"] = f"gold SQL failed: {e}"
+        return result
+    result["gold_hash"] = result_hash(gold)
+    if not pred_sql:
+        result["correct"] = False
+        result["error"] = "no SQL produced"
+        return result
+    try:
+        pred_rows = _run(pred_sql)
+    except Exception as e:
+        result["correct"] = False
+        result["error"] = str(e)
+        return result
+    pred = normalize_rows(pred_rows, ordered)
+    result["pred_hash"] = result_hash(pred)
+    result["correct"] = result["pred_hash"] == result["gold_hash"] or _projection_matches(gold, pred, ordered)
+    return result
+
+
+def evaluate(items, fixture, workers=None):
+    # Scores (question, gold SQL, predicted SQL) triples against the database
+    # behind the `fixture` connection and returns one result per item, in
+    # order. Each worker process gets its own in-memory copy of the fixture.
+    items = list(items)
+    if not items:
+        return []
+    image = fixture.serialize()
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(image,)) as pool:
+        return list(pool.map(evaluate_one, items, chunksize=chunksize))
@@ -1,17 +1,44 @@
+import json
 import os
 import sqlite3
-import pandas as pd
 import uuid
-import concurrent.futures
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from ollama import chat
 from pydantic import BaseModel
 from typing import Optional
+from ingest import ingest_csv, ingest_json
+from schema_cache import SchemaCache
+from db import ConnectionPool
+from llm import LLMClient
+from sql_cache import QueryCache, schema_fingerprint
+from result_cache import ResultCache, estimate_size
+from sql_tokens import referenced_tables, rename_identifiers
+from sql_validator import validate_sql
+from governor import QueryGovernor, QueryTooExpensive
+from index_advisor import IndexAdvisor
+from partial_json import FieldStream
+from schema_linker import SchemaIndex
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    decode_page_token,
+    encode_page_token,
+    fetch_page,
+    iter_ndjson,
+    parse_page_size,
+)
 
 DB_PATH = "data.db"
 timeout_seconds = 60
 uploaded_tables = []  
+pool = ConnectionPool(DB_PATH)
+llm = LLMClient(timeout=timeout_seconds)
+query_cache = QueryCache()
+result_cache = ResultCache()
+governor = QueryGovernor()
+index_advisor = IndexAdvisor(pool, governor)
+# Runs streamed queries' SQL while the model is still writing the explanation
+sql_executor = ThreadPoolExecutor(thread_name_prefix="stream-sql")
 
 app = Flask(__name__)
 CORS(app)
@@ -21,82 +48,255 @@ class SQLResponse(BaseModel):
     explanation: str
 
 def clear_all_tables():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = cursor.fetchall()
-    for (table_name,) in tables:
-        print(f"[DB] Dropping table: {table_name}")
-        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = cursor.fetchall()
+        for (table_name,) in tables:
+            print(f"[DB] Dropping table: {table_name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        conn.commit()
+    uploaded_tables.clear()
+    schema_cache.invalidate()
+    result_cache.clear()
+    index_advisor.reset()
     print("[DB] All tables cleared.")
 
 def get_table_schema(table_name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    schema_info = cursor.fetchall()
-    conn.close()
-    return schema_info
+    with pool.reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        return cursor.fetchall()
 
 def _chat_call(prompt_content: str) -> SQLResponse:
     print(f"[LLM] Sending prompt:\n{prompt_content}")
-    response = chat(
-        messages=[{"role": "user", "content": prompt_content}],
-        model="text2sql",
-        format=SQLResponse.model_json_schema(),
-    )
-    return SQLResponse.model_validate_json(response.message.content)
+    return llm.chat_json(prompt_content, SQLResponse)
 
-def generate_sql(nl_query: str, prev_sql: Optional[str] = None, prev_error: Optional[str] = None) -> SQLResponse:
-    # Build schema hint dynamically from uploaded tables
+def format_schema(tables) -> str:
     schema_hint = "Database schema:\n"
+    for name, columns in tables.items():
+        schema_hint += f"{name}({', '.join(columns)})\n"
+    return schema_hint
+
+def stable_names():
+    # Each uploaded table's name without its random suffix: the file name,
+    # numbered if the same file was uploaded more than once. Cached SQL is
+    # stored with these, so it still applies after a restart or re-upload.
+    names = {}
+    seen = {}
     for t in uploaded_tables:
-        schema_hint += f"{t['name']}({', '.join([col[1] for col in t['schema']])})\n"
+        source = t.get("source", t["name"])
+        seen[source] = seen.get(source, 0) + 1
+        names[t["name"]] = source if seen[source] == 1 else f"{source}_{seen[source]}"
+    return names
 
+def build_schema_context(_cursor=None):
+    # Build schema hint dynamically from uploaded tables
+    tables = {t["name"]: [col[1] for col in t["schema"]] for t in uploaded_tables}
+    with pool.reader() as conn:
+        index = SchemaIndex.from_connection(conn, list(tables))
+    names = stable_names()
+    layout = sorted(
+        f"{names[t['name']]}({', '.join(f'{col[1]} {col[2]}' for col in t['schema'])})" for t in uploaded_tables
+    )
+    return {
+        "hint": format_schema(tables),
+        "tables": tables,
+        # Query cache key: column names and types under the stable names
+        "fingerprint": schema_fingerprint("\n".join(layout)),
+        "names": names,
+        # Picks the tables and columns a question needs, see linked_schema()
+        "index": index,
+    }
+
+# Rebuilt only when a table is uploaded or dropped
+schema_cache = SchemaCache(build_schema_context)
+
+def linked_schema(nl_query: str, prev_sql: Optional[str] = None, prev_error: Optional[str] = None) -> str:
+    # Only the uploaded tables and columns relevant to the request, so prompts
+    # stay small however many files have been uploaded. A retry keeps the
+    # tables the failed SQL used and also links the words of its error.
+    context = schema_cache.get()
     if prev_sql is None or prev_error is None:
-        prompt_content = schema_hint + f"\nConvert to SQLite SQL and explain:\n{nl_query}"
-    else:
-        prompt_content = schema_hint + f"\nPrevious SQL:\n{prev_sql}\nError:\n{prev_error}\nOriginal request:\n{nl_query}\nFix the SQL."
+        return format_schema(context["index"].link(nl_query))
+    used = referenced_tables(prev_sql, context["tables"])
+    return format_schema(context["index"].link(f"{nl_query}\n{prev_error}", include=used))
+
+def build_prompt(nl_query: str, prev_sql: Optional[str] = None, prev_error: Optional[str] = None) -> str:
+    schema_hint = linked_schema(nl_query, prev_sql, prev_error)
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(_chat_call, prompt_content)
-        return future.result(timeout=timeout_seconds)
+    if prev_sql is None or prev_error is None:
+        return schema_hint + f"\nConvert to SQLite SQL and explain:\n{nl_query}"
+    return schema_hint + f"\nPrevious SQL:\n{prev_sql}\nError:\n{prev_error}\nOriginal request:\n{nl_query}\nFix the SQL."
+
+def generate_sql(nl_query: str, prev_sql: Optional[str] = None, prev_error: Optional[str] = None) -> SQLResponse:
+    return _chat_call(build_prompt(nl_query, prev_sql, prev_error))
+
+def check_sql(sql_query: str) -> str:
+    # Catches bad SQL before it touches any data; returns the repaired SQL
+    with pool.reader() as conn:
+        return validate_sql(conn, sql_query, schema_cache.get()["tables"])
+
+def run_sql(sql_query: str, offset: int = 0, page_size: int = DEFAULT_PAGE_SIZE):
+    # Returns (rows, has_more) for one page of the result
+    tables = referenced_tables(sql_query, [t["name"] for t in uploaded_tables])
+    # Recorded before the result cache is consulted, so the advisor counts
+    # every time a query is asked for, not just the times it runs
+    if offset == 0:
+        index_advisor.record(sql_query, schema_cache.get()["tables"])
+    cache_key = None
+    if result_cache.cacheable(sql_query, tables):
+        cache_key = result_cache.key(sql_query, tables) + (offset, page_size)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            print(f"[CACHE] Result cache hit for tables {tables}")
+            return cached
+
+    # Only hold a connection while the SQL runs, not while the model thinks
+    with pool.reader() as conn, governor.guard(conn) as budget:
+        cursor = conn.cursor()
+        cursor.execute(sql_query)
+        column_names = [description[0] for description in cursor.description]
+        rows, has_more = fetch_page(cursor, offset, page_size)
+    size = estimate_size(rows)
+    budget.add_result(len(rows), size)
+
+    # add column names to the beginning of the rows
+    rows = [column_names] + rows if rows else []
+    if cache_key is not None:
+        result_cache.put(cache_key, (rows, has_more), size)
+    return rows, has_more
+
+def page_fields(sql_query: str, rows, has_more: bool, offset: int, page_size: int):
+    next_offset = offset + page_size
+    return {
+        "rows": rows,
+        "page_size": page_size,
+        "next_page_token": encode_page_token(sql_query, next_offset, page_size) if has_more else None
+    }
 
-def execute_with_retry(nl_query: str, max_retries=5):
+def next_page(page_token: str):
+    # Later pages re-run the SQL from the token, the model is not involved
+    sql_query, offset, page_size = decode_page_token(page_token)
+    try:
+        rows, has_more = run_sql(sql_query, offset, page_size)
+    except QueryTooExpensive as e:
+        return {"success": False, "sql": sql_query, **e.to_dict()}
+    except sqlite3.Error as e:
+        # e.g. the table was dropped since the first page
+        return {"success": False, "sql": sql_query, "error": str(e)}
+    return {"success": True, "sql": sql_query, **page_fields(sql_query, rows, has_more, offset, page_size)}
+
+class ResultStream:
+    # A query answered as NDJSON runs once: the SQL executes when this is
+    # created, so its errors can still be retried, and body() then reads every
+    # row from that same cursor under the same budget. The reader connection
+    # is held until the body has been read or close() is called.
+    def __init__(self, sql_query: str):
+        index_advisor.record(sql_query, schema_cache.get()["tables"])
+        self._chunks = self._run(sql_query)
+        next(self._chunks)
+
+    def _run(self, sql_query: str):
+        meta = None
+        try:
+            with pool.reader() as conn, governor.guard(conn) as budget:
+                cursor = conn.cursor()
+                cursor.execute(sql_query)
+                with budget.paused():
+                    meta = yield
+                for chunk in iter_ndjson(meta, cursor, budget.add_result):
+                    # Only time spent fetching counts, not time the client takes
+                    with budget.paused():
+                        yield chunk
+        except QueryTooExpensive as e:
+            if meta is None:
+                raise
+            # The response has already started, so the error goes in the body
+            yield json.dumps(e.to_dict()) + "\n"
+
+    def body(self, meta: dict):
+        # Metadata, then every row of the result
+        yield self._chunks.send(meta)
+        yield from self._chunks
+
+    def close(self):
+        self._chunks.close()
+
+def first_page(sql_query: str, page_size: int, stream: bool = False):
+    # Response fields for a query's first run: its first page, or with
+    # `stream` the ResultStream its NDJSON body is read from
+    if stream:
+        return {"stream": ResultStream(sql_query)}
+    rows, has_more = run_sql(sql_query, 0, page_size)
+    return page_fields(sql_query, rows, has_more, 0, page_size)
+
+def stream_result(result):
+    # NDJSON body for a successful query run with stream=True
+    meta = {key: result[key] for key in ("success", "attempts", "sql", "explanation")}
+    return result["stream"].body(meta)
+
+def lookup_cached(nl_query: str, page_size: int = DEFAULT_PAGE_SIZE, stream: bool = False):
+    context = schema_cache.get()
+    hit = query_cache.get(nl_query, context["fingerprint"])
+    if hit is None:
+        return None
+    hit["sql"] = rename_identifiers(hit["sql"], {stable: name for name, stable in context["names"].items()})
+    try:
+        fields = first_page(hit["sql"], page_size, stream)
+    except Exception as e:
+        print(f"[CACHE] Cached SQL failed, regenerating: {e}")
+        query_cache.discard(hit["key"])
+        return None
+    print(f"[CACHE] {hit['match'].capitalize()} hit for: {nl_query}")
+    return {
+        "success": True,
+        "attempts": 0,
+        "sql": hit["sql"],
+        "explanation": hit["explanation"],
+        **fields,
+        "cached": hit["match"]
+    }
+
+def remember(nl_query: str, sql_query: str, explanation: str):
+    context = schema_cache.get()
+    query_cache.put(nl_query, context["fingerprint"], rename_identifiers(sql_query, context["names"]), explanation)
+
+def execute_with_retry(nl_query: str, max_retries=5, page_size: int = DEFAULT_PAGE_SIZE, stream: bool = False):
+    # With `stream`, a successful result carries a ResultStream instead of
+    # its first page; see stream_result
     attempt = 0
     last_sql = None
     last_error = None
+    last_error_type = None
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cached = lookup_cached(nl_query, page_size, stream)
+    if cached is not None:
+        return cached
 
     while attempt < max_retries:
         attempt += 1
         print(f"[QUERY] Attempt {attempt} for: {nl_query}")
         try:
             sql_response = generate_sql(nl_query, prev_sql=last_sql, prev_error=last_error)
-            sql_query = sql_response.sql.replace("WHEREING", "WHERE")
+            sql_query = sql_response.sql
             print(f"[QUERY] Generated SQL:\n{sql_query}")
-            cursor.execute(sql_query)
-            column_names = [description[0] for description in cursor.description]
-            rows = cursor.fetchall()
-
-            rows = [column_names] + rows if rows else []
-
-            # add column names to the beginning of the rows
-            print(f"[QUERY] Success. Returned {len(rows)} rows.")
+            sql_query = check_sql(sql_query)
+            fields = first_page(sql_query, page_size, stream)
+            remember(nl_query, sql_query, sql_response.explanation)
+            print("[QUERY] Success. Streaming rows." if stream else f"[QUERY] Success. Returned {len(fields['rows'])} rows.")
             return {
                 "success": True,
                 "attempts": attempt,
                 "sql": sql_query,
                 "explanation": sql_response.explanation,
-                "rows": rows
+                **fields
             }
         except Exception as e:
             last_sql = sql_query if 'sql_query' in locals() else None
             last_error = str(e)
+            # Budget overruns go back to the model too, so it can try a cheaper query
+            last_error_type = getattr(e, "error_type", None)
             print(f"[ERROR] Attempt {attempt} failed: {last_error}")
 
     print(f"[ERROR] Max retries reached. Last error: {last_error}")
@@ -104,62 +304,182 @@ def execute_with_retry(nl_query: str, max_retries=5):
         "success": False,
         "attempts": attempt,
         "sql": last_sql,
-        "error": last_error
+        "error": last_error,
+        "error_type": last_error_type
     }
 
-@app.route("/upload", methods=["POST"])
-def upload_file():
-    if "file" not in request.files:
-        print("[UPLOAD] No file in request.")
-        return jsonify({"error": "No file uploaded"}), 400
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    file = request.files["file"]
-    if file.filename == "":
-        print("[UPLOAD] Empty filename.")
-        return jsonify({"error": "Empty filename"}), 400
+def prepare_sql(sql_query: str, page_size: int):
+    sql_query = check_sql(sql_query)
+    rows, has_more = run_sql(sql_query, 0, page_size)
+    return sql_query, rows, has_more
+
+def stream_query(nl_query: str, max_retries=5, page_size: int = DEFAULT_PAGE_SIZE):
+    # Server-sent events for /query with "stream": "sse". Model output is
+    # forwarded as `token` events while the reply is parsed; the SQL starts
+    # running as soon as its field is complete, while the explanation is still
+    # being generated, and its first page goes out as a `rows` event. The
+    # last event, `result`, has the same body /query returns without streaming.
+    cached = lookup_cached(nl_query, page_size)
+    if cached is not None:
+        yield sse("result", cached)
+        return
+
+    last_sql = None
+    last_error = None
+    last_error_type = None
+    for attempt in range(1, max_retries + 1):
+        print(f"[QUERY] Streaming attempt {attempt} for: {nl_query}")
+        yield sse("attempt", {"attempt": attempt})
+        parser = FieldStream()
+        running = None
+        rows_sent = False
+        tokens = llm.stream(build_prompt(nl_query, last_sql, last_error), SQLResponse.model_json_schema())
+        try:
+            for chunk in tokens:
+                for kind, field, value in parser.feed(chunk):
+                    if kind == "delta":
+                        yield sse("token", {"field": field, "delta": value})
+                    elif kind == "field" and field == "sql" and running is None:
+                        print(f"[QUERY] Generated SQL:\n{value}")
+                        last_sql = value
+                        running = sql_executor.submit(prepare_sql, value, page_size)
+                if running is not None and running.done() and not rows_sent:
+                    # A failed query raises here and cuts the generation short
+                    sql_query, rows, has_more = running.result()
+                    rows_sent = True
+                    yield sse("rows", {"sql": sql_query, **page_fields(sql_query, rows, has_more, 0, page_size)})
+            if running is None:
+                raise ValueError("The model's reply had no sql field")
+            sql_query, rows, has_more = running.result()
+            if not rows_sent:
+                yield sse("rows", {"sql": sql_query, **page_fields(sql_query, rows, has_more, 0, page_size)})
+            explanation = parser.fields.get("explanation", "")
+            remember(nl_query, sql_query, explanation)
+            print(f"[QUERY] Success. Returned {len(rows)} rows.")
+            yield sse("result", {
+                "success": True,
+                "attempts": attempt,
+                "sql": sql_query,
+                "explanation": explanation,
+                **page_fields(sql_query, rows, has_more, 0, page_size)
+            })
+            return
+        except Exception as e:
+            last_error = str(e)
+            last_error_type = getattr(e, "error_type", None)
+            print(f"[ERROR] Attempt {attempt} failed: {last_error}")
+            yield sse("retry", {"attempt": attempt, "sql": last_sql, "error": last_error, "error_type": last_error_type})
+        finally:
+            tokens.close()
+
+    print(f"[ERROR] Max retries reached. Last error: {last_error}")
+    yield sse("result", {
+        "success": False,
+        "attempts": max_retries,
+        "sql": last_sql,
+        "error": last_error,
+        "error_type": last_error_type
+    })
 
+def save_upload(file):
+    # Shared by the Flask and ASGI apps; returns (payload, status)
     table_name = os.path.splitext(file.filename)[0]
-    table_name = table_name.replace(" ", "_").replace("-", "_")
-    table_name = f"{table_name}_{uuid.uuid4().hex[:6]}"
+    source = table_name.replace(" ", "_").replace("-", "_")
+    table_name = f"{source}_{uuid.uuid4().hex[:6]}"
 
     try:
         if file.filename.lower().endswith(".csv"):
-            df = pd.read_csv(file)
+            ingest = ingest_csv
         elif file.filename.lower().endswith(".json"):
-            df = pd.read_json(file)
+            ingest = ingest_json
         else:
             print("[UPLOAD] Unsupported format.")
-            return jsonify({"error": "Only CSV and JSON supported"}), 400
+            return {"error": "Only CSV and JSON supported"}, 400
 
-        conn = sqlite3.connect(DB_PATH)
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
-        conn.close()
-        print(f"[DB] Created table '{table_name}' with {len(df)} rows.")
+        with pool.writer() as conn:
+            stats = ingest(file.stream, conn, table_name)
+        print(f"[DB] Created table '{table_name}' with {stats['rows']} rows ({stats['rows_per_sec']} rows/sec).")
 
-        schema_info = get_table_schema(table_name)
-        uploaded_tables.append({"name": table_name, "schema": schema_info})
+        # Report the inferred types (DATE, BOOLEAN, ...) rather than the
+        # storage classes SQLite declares them as.
+        schema_info = [
+            (cid, name, stats["types"].get(name, col_type), *rest)
+            for cid, name, col_type, *rest in get_table_schema(table_name)
+        ]
+        uploaded_tables.append({"name": table_name, "source": source, "schema": schema_info})
+        schema_cache.invalidate()
+        result_cache.bump(table_name)
 
-        return jsonify({
+        return {
             "message": "File uploaded successfully",
             "table_name": table_name,
-            "schema": schema_info
-        })
+            "schema": schema_info,
+            "rows": stats["rows"],
+            "seconds": stats["seconds"],
+            "rows_per_sec": stats["rows_per_sec"]
+        }, 200
     except Exception as e:
         print(f"[ERROR] Upload failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+@app.route("/upload", methods=["POST"])
+def upload_file():
+    if "file" not in request.files:
+        print("[UPLOAD] No file in request.")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files["file"]
+    if file.filename == "":
+        print("[UPLOAD] Empty filename.")
+        return jsonify({"error": "Empty filename"}), 400
+
+    payload, status = save_upload(file)
+    return jsonify(payload), status
 
 @app.route("/tables", methods=["GET"])
 def list_tables():
     print(f"[API] Returning {len(uploaded_tables)} uploaded tables.")
     return jsonify(uploaded_tables)
 
+@app.route("/indexes", methods=["GET"])
+def list_indexes():
+    return jsonify(index_advisor.report())
+
 @app.route("/query", methods=["POST"])
 def run_query():
     data = request.get_json()
+    if data and data.get("page_token"):
+        try:
+            return jsonify(next_page(data["page_token"]))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
     if not data or "nl_query" not in data:
         print("[QUERY] Missing 'nl_query'.")
         return jsonify({"error": "Missing 'nl_query'"}), 400
-    return jsonify(execute_with_retry(data["nl_query"]))
+    try:
+        page_size = parse_page_size(data.get("page_size"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if data.get("stream") == "sse":
+        return Response(
+            stream_with_context(stream_query(data["nl_query"], page_size=page_size)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    # Decided before the SQL runs, so a streamed query runs only once
+    streaming = bool(data.get("stream"))
+    result = execute_with_retry(data["nl_query"], page_size=page_size, stream=streaming)
+    if streaming and result["success"]:
+        response = Response(stream_with_context(stream_result(result)), mimetype="application/x-ndjson")
+        # Also releases the connection if the body is never read
+        response.call_on_close(result["stream"].close)
+        return response
+    return jsonify(result)
 
 if __name__ == "__main__":
     print("[INIT] Clearing existing tables...")
@@ -0,0 +1,225 @@
+import asyncio
+from quart import Quart, Response, request, jsonify
+from api import (
+    SQLResponse,
+    build_prompt,
+    check_sql,
+    clear_all_tables,
+    first_page,
+    index_advisor,
+    lookup_cached,
+    next_page,
+    page_fields,
+    prepare_sql,
+    remember,
+    save_upload,
+    sse,
+    stream_result,
+    timeout_seconds,
+    uploaded_tables,
+)
+from llm import AsyncLLMClient
+from partial_json import FieldStream
+from pagination import DEFAULT_PAGE_SIZE, parse_page_size
+
+# ASGI variant of api.py with the same /upload, /tables, /indexes and /query contract.
+# Run with any ASGI server, e.g. `hypercorn async_api:app`.
+
+llm = AsyncLLMClient(timeout=timeout_seconds)
+
+app = Quart(__name__)
+
+@app.after_request
+async def add_cors_headers(response):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+async def _chat_call(prompt_content: str) -> SQLResponse:
+    print(f"[LLM] Sending prompt:\n{prompt_content}")
+    return await llm.chat_json(prompt_content, SQLResponse)
+
+async def generate_sql(nl_query: str, prev_sql=None, prev_error=None) -> SQLResponse:
+    return await _chat_call(build_prompt(nl_query, prev_sql, prev_error))
+
+async def execute_with_retry(nl_query: str, max_retries=5, page_size: int = DEFAULT_PAGE_SIZE, stream: bool = False):
+    attempt = 0
+    last_sql = None
+    last_error = None
+    last_error_type = None
+
+    cached = await asyncio.to_thread(lookup_cached, nl_query, page_size, stream)
+    if cached is not None:
+        return cached
+
+    while attempt < max_retries:
+        attempt += 1
+        sql_query = None
+        print(f"[QUERY] Attempt {attempt} for: {nl_query}")
+        try:
+            sql_response = await generate_sql(nl_query, prev_sql=last_sql, prev_error=last_error)
+            sql_query = sql_response.sql
+            print(f"[QUERY] Generated SQL:\n{sql_query}")
+            sql_query = await asyncio.to_thread(check_sql, sql_query)
+            # SQLite calls block, so they run on the default thread pool
+            fields = await asyncio.to_thread(first_page, sql_query, page_size, stream)
+            await asyncio.to_thread(remember, nl_query, sql_query, sql_response.explanation)
+            print("[QUERY] Success. Streaming rows." if stream else f"[QUERY] Success. Returned {len(fields['rows'])} rows.")
+            return {
+                "success": True,
+                "attempts": attempt,
+                "sql": sql_query,
+                "explanation": sql_response.explanation,
+                **fields
+            }
+        except Exception as e:
+            last_sql = sql_query
+            last_error = str(e)
+            last_error_type = getattr(e, "error_type", None)
+            print(f"[ERROR] Attempt {attempt} failed: {last_error}")
+
+    print(f"[ERROR] Max retries reached. Last error: {last_error}")
+    return {
+        "success": False,
+        "attempts": attempt,
+        "sql": last_sql,
+        "error": last_error,
+        "error_type": last_error_type
+    }
+
+async def _stream_async(result):
+    # Each chunk is pulled from SQLite on a worker thread
+    chunks = stream_result(result)
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        await asyncio.to_thread(result["stream"].close)
+
+async def stream_query(nl_query: str, max_retries=5, page_size: int = DEFAULT_PAGE_SIZE):
+    # Same events as api.stream_query; the SQL runs on a worker thread while
+    # the model is still generating.
+    cached = await asyncio.to_thread(lookup_cached, nl_query, page_size)
+    if cached is not None:
+        yield sse("result", cached)
+        return
+
+    last_sql = None
+    last_error = None
+    last_error_type = None
+    for attempt in range(1, max_retries + 1):
+        print(f"[QUERY] Streaming attempt {attempt} for: {nl_query}")
+        yield sse("attempt", {"attempt": attempt})
+        parser = FieldStream()
+        running = None
+        rows_sent = False
+        tokens = llm.stream(build_prompt(nl_query, last_sql, last_error), SQLResponse.model_json_schema())
+        try:
+            async for chunk in tokens:
+                for kind, field, value in parser.feed(chunk):
+                    if kind == "delta":
+                        yield sse("token", {"field": field, "delta": value})
+                    elif kind == "field" and field == "sql" and running is None:
+                        print(f"[QUERY] Generated SQL:\n{value}")
+                        last_sql = value
+                        running = asyncio.create_task(asyncio.to_thread(prepare_sql, value, page_size))
+                if running is not None and running.done() and not rows_sent:
+                    sql_query, rows, has_more = running.result()
+                    rows_sent = True
+                    yield sse("rows", {"sql": sql_query, **page_fields(sql_query, rows, has_more, 0, page_size)})
+            if running is None:
+                raise ValueError("The model's reply had no sql field")
+            sql_query, rows, has_more = await running
+            if not rows_sent:
+                yield sse("rows", {"sql": sql_query, **page_fields(sql_query, rows, has_more, 0, page_size)})
+            explanation = parser.fields.get("explanation", "")
+            await asyncio.to_thread(remember, nl_query, sql_query, explanation)
+            print(f"[QUERY] Success. Returned {len(rows)} rows.")
+            yield sse("result", {
+                "success": True,
+                "attempts": attempt,
+                "sql": sql_query,
+                "explanation": explanation,
+                **page_fields(sql_query, rows, has_more, 0, page_size)
+            })
+            return
+        except Exception as e:
+            last_error = str(e)
+            last_error_type = getattr(e, "error_type", None)
+            print(f"[ERROR] Attempt {attempt} failed: {last_error}")
+            yield sse("retry", {"attempt": attempt, "sql": last_sql, "error": last_error, "error_type": last_error_type})
+        finally:
+            await tokens.aclose()
+
+    print(f"[ERROR] Max retries reached. Last error: {last_error}")
+    yield sse("result", {
+        "success": False,
+        "attempts": max_retries,
+        "sql": last_sql,
+        "error": last_error,
+        "error_type": last_error_type
+    })
+
+@app.route("/upload", methods=["POST"])
+async def upload_file():
+    files = await request.files
+    if "file" not in files:
+        print("[UPLOAD] No file in request.")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = files["file"]
+    if file.filename == "":
+        print("[UPLOAD] Empty filename.")
+        return jsonify({"error": "Empty filename"}), 400
+
+    payload, status = await asyncio.to_thread(save_upload, file)
+    return jsonify(payload), status
+
+@app.route("/tables", methods=["GET"])
+async def list_tables():
+    print(f"[API] Returning {len(uploaded_tables)} uploaded tables.")
+    return jsonify(uploaded_tables)
+
+@app.route("/indexes", methods=["GET"])
+async def list_indexes():
+    return jsonify(index_advisor.report())
+
+@app.route("/query", methods=["POST"])
+async def run_query():
+    data = await request.get_json(silent=True)
+    if data and data.get("page_token"):
+        try:
+            return jsonify(await asyncio.to_thread(next_page, data["page_token"]))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    if not data or "nl_query" not in data:
+        print("[QUERY] Missing 'nl_query'.")
+        return jsonify({"error": "Missing 'nl_query'"}), 400
+    try:
+        page_size = parse_page_size(data.get("page_size"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if data.get("stream") == "sse":
+        return Response(
+            stream_query(data["nl_query"], page_size=page_size),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    # Decided before the SQL runs, so a streamed query runs only once
+    streaming = bool(data.get("stream"))
+    result = await execute_with_retry(data["nl_query"], page_size=page_size, stream=streaming)
+    if streaming and result["success"]:
+        return Response(_stream_async(result), mimetype="application/x-ndjson")
+    return jsonify(result)
+
+@app.before_serving
+async def startup():
+    print("[INIT] Clearing existing tables...")
+    await asyncio.to_thread(clear_all_tables)
+
+if __name__ == "__main__":
+    print("[SERVER] Starting Quart app...")
+    app.run()
@@ -0,0 +1,82 @@
+import concurrent.futures
+import json
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class MicroBatcher:
+    # Collects prompts submitted by concurrent requests for up to `max_wait`
+    # seconds (or `max_batch_size` prompts) and sends the batch to the model
+    # together, so it lands in Ollama's parallel slots at once instead of
+    # trickling in. Identical prompts within a batch are sent only once.
+    #
+    # No new batch is started while all `parallel` slots are busy, so under
+    # load requests accumulate and batches grow on their own.
+    def __init__(self, call, max_batch_size=8, max_wait=0.01, parallel=4):
+        self._call = call
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(parallel)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="llm-batch")
+        self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, format=None):
+        future = concurrent.futures.Future()
+        self._queue.put((prompt, format, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                if item is _STOP:
+                    continue
+                prompt, format, future = item
+                # Callers cancel futures that timed out while still queued.
+                if not future.set_running_or_notify_cancel():
+                    continue
+                key = (prompt, json.dumps(format, sort_keys=True))
+                groups.setdefault(key, (prompt, format, []))[2].append(future)
+
+            if len(batch) > 1:
+                print(f"[LLM] Dispatching batch of {len(batch)} prompts ({len(groups)} unique)")
+            for prompt, format, futures in groups.values():
+                self._slots.acquire()
+                self._executor.submit(self._dispatch, prompt, format, futures)
+
+            if batch[-1] is _STOP:
+                return
+
+    def _dispatch(self, prompt, format, futures):
+        try:
+            result = self._call(prompt, format)
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import ollama
+import requests
+from ollama import ChatResponse
+
+# Content-addressed record/replay of model calls. A call is keyed by a hash
+# of everything that affects the answer (endpoint, model, prompt or messages,
+# format, options, tools); its response is stored zlib-compressed in SQLite.
+#   off     always call the model (default)
+#   record  always call the model and store the response
+#   replay  only answer from the store; a miss raises CassetteMiss
+#   auto    answer from the store, calling and storing on a miss
+MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+# Next to this module, so runs from any directory share one cassette
+PATH = os.getenv("LLM_CASSETTE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cassette.db"))
+MODES = ("off", "record", "replay", "auto")
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class Cassette:
+    def __init__(self, path=PATH, mode=MODE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, model TEXT, body BLOB, recorded_at REAL)"
+            )
+        return self._conn
+
+    @staticmethod
+    def key(endpoint, request):
+        canonical = json.dumps({"endpoint": endpoint, **request}, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db().execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, key, endpoint, model, response):
+        body = zlib.compress(json.dumps(response, separators=(",", ":")).encode(), 9)
+        with self._lock:
+            with self._db() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, endpoint, model, body, time.time()),
+                )
+
+    def call(self, endpoint, request, live):
+        # `live()` makes the real call and returns the response as a dict.
+        if self.mode == "off":
+            return live()
+        key = self.key(endpoint, request)
+        if self.mode in ("replay", "auto"):
+            stored = self.get(key)
+            if stored is not None:
+                self.hits += 1
+                return stored
+            self.misses += 1
+            if self.mode == "replay":
+                raise CassetteMiss(f"No recorded response for this {endpoint} call (model {request.get('model')})")
+        response = live()
+        self.put(key, endpoint, request.get("model"), response)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cassette = Cassette()
+
+
+def configure(mode=None, path=None):
+    global _cassette
+    _cassette.close()
+    _cassette = Cassette(path or _cassette.path, mode or _cassette.mode)
+    return _cassette
+
+
+def current():
+    return _cassette
+
+
+def _request(model, messages=None, prompt=None, format=None, options=None, tools=None):
+    request = {"model": model, "format": format, "options": options}
+    if messages is not None:
+        request["messages"] = messages
+    if prompt is not None:
+        request["prompt"] = prompt
+    if tools:
+        request["tools"] = tools
+    return request
+
+
+def _model_dict(response):
+    return response.model_dump(mode="json", exclude_none=True)
+
+
+def chat(model="", messages=None, format=None, options=None, tools=None, client=None, **kwargs):
+    # Drop-in for ollama.chat(); streaming calls always go to the model.
+    client = client or ollama
+    if _cassette.mode == "off" or kwargs.get("stream"):
+        return client.chat(model=model, messages=messages, format=format, options=options, tools=tools, **kwargs)
+    request = _request(model, messages=messages, format=format, options=options, tools=tools)
+    response = _cassette.call(
+        "chat", request,
+        lambda: _model_dict(client.chat(model=model, messages=messages, format=format, options=options, tools=tools, **kwargs)),
+    )
+    return ChatResponse.model_validate(response)
+
+
+async def achat(client, model="", messages=None, format=None, options=None, **kwargs):
+    # chat() for an ollama.AsyncClient. The store is local SQLite and quick
+    # enough to use from the event loop.
+    cassette = _cassette
+    if cassette.mode == "off" or kwargs.get("stream"):
+        return await client.chat(model=model, messages=messages, format=format, options=options, **kwargs)
+    request = _request(model, messages=messages, format=format, options=options)
+    key = cassette.key("chat", request)
+    if cassette.mode in ("replay", "auto"):
+        stored = cassette.get(key)
+        if stored is not None:
+            cassette.hits += 1
+            return ChatResponse.model_validate(stored)
+        cassette.misses += 1
+        if cassette.mode == "replay":
+            raise CassetteMiss(f"No recorded response for this chat call (model {model})")
+    response = await client.chat(model=model, messages=messages, format=format, options=options, **kwargs)
+    cassette.put(key, "chat", model, _model_dict(response))
+    return response
+
+
+def generate(url, payload, timeout=None):
+    # POST to /api/generate and return the JSON body, as main.py does with
+    # requests.post(OLLAMA_URL, json=payload).
+    def live():
+        res = requests.post(url, json=payload, timeout=timeout)
+        res.raise_for_status()
+        return res.json()
+
+    if _cassette.mode == "off" or payload.get("stream", True):
+        return live()
+    request = _request(payload.get("model"), prompt=payload.get("prompt"), format=payload.get("format"), options=payload.get("options"))
+    return _cassette.call("generate", request, live)
@@ -1,9 +1,15 @@
 import sqlite3
-from ollama import chat
+from cassette import chat
 from pydantic import BaseModel
 from typing import Optional, Dict
 import json
 import logging
+import argparse
+from metrics import record_llm_call, record_retry, timed_sql
+from runner import DEFAULT_WORKERS, add_worker_args, run_concurrently
+from schema_cache import SchemaCache
+from schema_linker import SchemaIndex
+from sql_validator import validate_sql
 
 # Setup logging
 logging.basicConfig(
@@ -160,33 +166,55 @@ def sample_rows(cursor, table_name, limit=5):
     cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit};")
     return cursor.fetchall()
 
-def get_schema_and_samples(cursor, sample_limit=5):
+def _build_schema_and_samples(cursor, sample_limit):
     logger.info("Fetching database schema and sample data for prompt context...")
-    schema_info = "Database schema and sample data:\n\n"
+    tables = {}
 
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-    tables = [row[0] for row in cursor.fetchall()]
+    for (table,) in cursor.fetchall():
+        cursor.execute(f"PRAGMA table_info({table});")
+        columns = [(name, ctype) for cid, name, ctype, notnull, dflt_value, pk in cursor.fetchall()]
+        cursor.execute(f"SELECT * FROM {table} LIMIT {sample_limit};")
+        tables[table] = {"columns": columns, "rows": cursor.fetchall()}
+    index = SchemaIndex.from_connection(cursor.connection, list(tables))
+    logger.info("Schema and samples fetched.")
+    return {"tables": tables, "index": index}
 
-    for table in tables:
+def _format_schema_and_samples(tables, linked):
+    schema_info = "Database schema and sample data:\n\n"
+    for table, names in linked.items():
+        columns = tables[table]["columns"]
+        keep = [i for i, (name, ctype) in enumerate(columns) if name in names]
         schema_info += f"Table `{table}`:\n"
-        cursor.execute(f"PRAGMA table_info({table});")
-        columns = cursor.fetchall()
         schema_info += " Columns:\n"
-        for col in columns:
-            cid, name, ctype, notnull, dflt_value, pk = col
+        for i in keep:
+            name, ctype = columns[i]
             schema_info += f"  - {name} ({ctype})\n"
-        cursor.execute(f"SELECT * FROM {table} LIMIT {sample_limit};")
-        rows = cursor.fetchall()
+        rows = tables[table]["rows"]
         if rows:
             schema_info += " Sample rows:\n"
             for row in rows:
-                schema_info += f"  {row}\n"
+                schema_info += f"  {row if len(keep) == len(columns) else tuple(row[i] for i in keep)}\n"
         else:
             schema_info += " Sample rows: (no rows)\n"
         schema_info += "\n"
-    logger.info("Schema and samples fetched.")
+    if len(linked) < len(tables):
+        schema_info += f"Only the {len(linked)} of {len(tables)} tables most relevant to the request are shown; use list_tables and describe_table for the rest.\n"
     return schema_info
 
+# Only re-queried when the schema or data in the database changes
+schema_cache = SchemaCache(_build_schema_and_samples)
+
+def get_schema_and_samples(cursor, sample_limit=5, question=None):
+    # With a question, only the tables and columns it is linked to
+    context = schema_cache.get(cursor, sample_limit)
+    tables = context["tables"]
+    if question is None:
+        linked = {table: [name for name, ctype in info["columns"]] for table, info in tables.items()}
+    else:
+        linked = context["index"].link(question)
+    return _format_schema_and_samples(tables, linked)
+
 def run_tool_call(cursor, tool_call: ToolCall):
     tool = tool_call.tool_name
     args = tool_call.args
@@ -226,7 +254,7 @@ def generate_sql_with_tools(
     tool_result=None,
     max_steps=5
 ):
-    schema_hint = get_schema_and_samples(cursor)
+    schema_hint = get_schema_and_samples(cursor, question=nl_query)
 
     prompt_content = schema_hint
     prompt_content += "\nYou can call these tools by returning JSON with 'tool_call' key:\n"
@@ -259,6 +287,7 @@ def generate_sql_with_tools(
             model="text2sql",
             format=SQLResponse.model_json_schema(),
         )
+        record_llm_call(response)
         resp_text = response.message.content
         logger.info(f"Model response:\n{resp_text}")
 
@@ -277,17 +306,20 @@ def generate_sql_with_tools(
             continue
 
         elif resp.sql:
-            sql_query = resp.sql.replace("WHEREING", "WHERE")
+            sql_query = resp.sql
             logger.info(f"Executing SQL:\n{sql_query}")
             try:
-                cursor.execute(sql_query)
-                rows = cursor.fetchall()
+                sql_query = validate_sql(cursor.connection, sql_query)
+                with timed_sql(sql_query):
+                    cursor.execute(sql_query)
+                    rows = cursor.fetchall()
                 logger.info(f"SQL executed successfully. Rows returned: {len(rows)}")
                 return True
             except Exception as e:
                 logger.error(f"SQL execution error: {e}")
                 prev_sql = sql_query
                 prev_error = str(e)
+                record_retry()
                 prompt_content += f"\nSQL error: {prev_error}\nPlease fix the query."
                 continue
 
@@ -298,12 +330,14 @@ def generate_sql_with_tools(
     logger.error("Max steps exceeded without success.")
     return False
 
-def benchmark_with_tools(queries, cursor):
-    correct_count = 0
-    for q in queries:
-        logger.info(f"Processing query: {q}")
-        if generate_sql_with_tools(q, cursor):
-            correct_count += 1
+def _run_query(q, db):
+    logger.info(f"Processing query: {q}")
+    return generate_sql_with_tools(q, db.cursor())
+
+def benchmark_with_tools(queries, cursor, workers=DEFAULT_WORKERS):
+    # Every worker gets its own copy of the database behind `cursor`
+    results = run_concurrently(_run_query, queries, workers, fixture=cursor.connection)
+    correct_count = sum(results)
     total = len(queries)
     print(f"\nBenchmark Score: {correct_count}/{total} correct")
 
@@ -338,5 +372,6 @@ queries = [
 ]
 
 if __name__ == "__main__":
-    benchmark_with_tools(queries, cursor)
+    args = add_worker_args(argparse.ArgumentParser()).parse_args()
+    benchmark_with_tools(queries, cursor, args.workers)
 
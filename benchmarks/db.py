@@ -0,0 +1,85 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+# Negative cache_size is in KiB, so this is a 64 MiB page cache per connection.
+CACHE_SIZE = -64 * 1024
+# Idle connections kept per kind; extra ones are closed when checked back in.
+MAX_IDLE = 16
+
+
+class ConnectionPool:
+    # Keeps connections open between requests so the page cache and mmap stay
+    # warm. Connections are checked out by one thread at a time, which lets the
+    # pool work with both long-lived worker threads and the thread-per-request
+    # dev server.
+    def __init__(self, db_path, max_idle=MAX_IDLE):
+        self.db_path = db_path
+        self._idle = {"writer": queue.LifoQueue(max_idle), "reader": queue.LifoQueue(max_idle)}
+        self._lock = threading.Lock()
+        self._wal_ready = False
+
+    def _configure(self, conn):
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+    def _open_writer(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self._configure(conn)
+        # WAL lets readers run concurrently with the single writer.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _open_reader(self):
+        with self._lock:
+            if not self._wal_ready:
+                # The file has to exist, and be in WAL mode, before it can be
+                # opened read-only.
+                self._open_writer().close()
+                self._wal_ready = True
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+        )
+        self._configure(conn)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def _checkout(self, kind, opener):
+        idle = self._idle[kind]
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = opener()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            try:
+                idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def writer(self):
+        return self._checkout("writer", self._open_writer)
+
+    def reader(self):
+        return self._checkout("reader", self._open_reader)
+
+    def close_all(self):
+        for idle in self._idle.values():
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
@@ -2,6 +2,7 @@ import sqlite3
 import logging
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama.llms import OllamaLLM
+from metrics import record_llm_call, timed_sql
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
@@ -46,13 +47,18 @@ Explanation:
 
 prompt = ChatPromptTemplate.from_template(template)
 model = OllamaLLM(model="text2sql")
-chain = prompt | model
 
-def run_sql_and_handle(question):
+def _generate(text):
+    # model.generate() rather than invoke() keeps Ollama's token counts and timings
+    generation = model.generate([text]).generations[0][0]
+    record_llm_call(generation.generation_info)
+    return generation.text
+
+def run_sql_and_handle(question, db=conn):
     logging.info(f"Received question: {question}")
 
     # Get model response
-    response = chain.invoke({"question": question})
+    response = _generate(prompt.invoke({"question": question}).to_string())
     logging.info("Model response received.")
 
     # Parse model output to extract SQL and Explanation
@@ -69,8 +75,9 @@ def run_sql_and_handle(question):
 
     # Try running the SQL query
     try:
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
+        with timed_sql(sql_query):
+            cursor = db.execute(sql_query)
+            rows = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description] if cursor.description else []
         logging.info("SQL query executed successfully.")
         
@@ -94,7 +101,7 @@ Error message:
 
 Please provide a corrected SQL query only.
 """
-        fix_response = model.invoke(fix_prompt).strip()
+        fix_response = _generate(fix_prompt).strip()
         logging.info("Received fix suggestion from model.")
         return {
             "query": sql_query,
@@ -103,21 +110,29 @@ Please provide a corrected SQL query only.
             "fix_suggestion": fix_response,
         }
 
-# Example usage
-question = "List all products with price greater than 500."
-result = run_sql_and_handle(question)
-
-if result.get("error") is None:
-    logging.info("Final successful result:")
-    print("SQL Query:\n", result["query"])
-    print("Explanation:\n", result["explanation"])
-    print("Results:")
-    print(result["result_columns"])
-    for row in result["result_rows"]:
-        print(row)
-else:
-    logging.warning("Encountered error with SQL execution:")
-    print("Error running query:", result["error"])
-    print("Original query:", result["query"])
-    print("Model fix suggestion:", result["fix_suggestion"])
+queries = [
+    "List all products with price greater than 500.",
+    "Which product has the highest price?",
+    "Show all categories along with the count of products in each.",
+    "Find the average price of electronics.",
+    "Get all products that are out of stock.",
+]
 
+# Example usage
+if __name__ == "__main__":
+    question = "List all products with price greater than 500."
+    result = run_sql_and_handle(question)
+
+    if result.get("error") is None:
+        logging.info("Final successful result:")
+        print("SQL Query:\n", result["query"])
+        print("Explanation:\n", result["explanation"])
+        print("Results:")
+        print(result["result_columns"])
+        for row in result["result_rows"]:
+            print(row)
+    else:
+        logging.warning("Encountered error with SQL execution:")
+        print("Error running query:", result["error"])
+        print("Original query:", result["query"])
+        print("Model fix suggestion:", result["fix_suggestion"])
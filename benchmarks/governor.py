@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+
+MAX_SECONDS = 10
+MAX_VM_STEPS = 200_000_000
+MAX_ROWS = 100_000
+MAX_RESULT_BYTES = 32 * 1024 * 1024
+# SQLite VM instructions between progress handler calls.
+PROGRESS_INTERVAL = 10_000
+
+_ADVICE = (
+    "Write a cheaper query: join on key columns instead of producing a cartesian product, "
+    "filter rows as early as possible, aggregate instead of returning raw rows, or add a LIMIT."
+)
+_LIMITS = {
+    "time": "the {limit}s execution time limit",
+    "vm_steps": "the {limit} step execution budget",
+    "rows": "the {limit} row result limit",
+    "bytes": "the {limit} byte result size limit",
+}
+
+
+class QueryTooExpensive(Exception):
+    error_type = "query_too_expensive"
+
+    def __init__(self, reason, limit):
+        self.reason = reason
+        self.limit = limit
+        super().__init__(f"Query too expensive: exceeded {_LIMITS[reason].format(limit=limit)}. {_ADVICE}")
+
+    def to_dict(self):
+        return {"error": str(self), "error_type": self.error_type, "reason": self.reason, "limit": self.limit}
+
+
+class Budget:
+    def __init__(self, governor):
+        self._governor = governor
+        # Time spent running the query so far; time while paused() is not
+        # counted, so a slow streaming client doesn't use up the budget
+        self.elapsed = 0.0
+        self._since = time.monotonic()
+        self.steps = 0
+        self.rows = 0
+        self.bytes = 0
+        self.tripped = None
+
+    def on_progress(self):
+        # A non-zero return makes SQLite interrupt the running statement,
+        # exactly as sqlite3_interrupt() would.
+        self.steps += PROGRESS_INTERVAL
+        if self.steps > self._governor.max_vm_steps:
+            self.tripped = "vm_steps"
+        elif self._since is not None and self.elapsed + time.monotonic() - self._since > self._governor.max_seconds:
+            self.tripped = "time"
+        return 1 if self.tripped else 0
+
+    @contextmanager
+    def paused(self):
+        # Wrap code that waits on something other than SQLite, such as a
+        # yield to the client between fetched batches.
+        self.elapsed += time.monotonic() - self._since
+        self._since = None
+        try:
+            yield
+        finally:
+            self._since = time.monotonic()
+
+    def add_result(self, rows, nbytes):
+        # Called as rows are handed out; totals are checked cumulatively.
+        self.rows += rows
+        self.bytes += nbytes
+        if self.rows > self._governor.max_rows:
+            raise QueryTooExpensive("rows", self._governor.max_rows)
+        if self.bytes > self._governor.max_bytes:
+            raise QueryTooExpensive("bytes", self._governor.max_bytes)
+
+
+class QueryGovernor:
+    # Per-query wall-time, VM-step, row-count and result-size budgets for
+    # generated SQL, enforced through SQLite's progress handler.
+    def __init__(self, max_seconds=MAX_SECONDS, max_vm_steps=MAX_VM_STEPS, max_rows=MAX_ROWS, max_bytes=MAX_RESULT_BYTES):
+        self.max_seconds = max_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+
+    @contextmanager
+    def guard(self, conn):
+        budget = Budget(self)
+        conn.set_progress_handler(budget.on_progress, PROGRESS_INTERVAL)
+        try:
+            yield budget
+        except sqlite3.OperationalError as e:
+            if budget.tripped is None:
+                raise
+            limit = self.max_seconds if budget.tripped == "time" else self.max_vm_steps
+            raise QueryTooExpensive(budget.tripped, limit) from e
+        finally:
+            conn.set_progress_handler(None, 0)
@@ -0,0 +1,181 @@
+import argparse
+import csv
+import json
+import logging
+import time
+from dataclasses import asdict
+import cassette
+from accuracy import evaluate, load_gold
+from metrics import Trace, tracing
+from runner import add_worker_args, run_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+# Each strategy is loaded lazily, so e.g. LangChain is only imported when its
+# strategy is asked for. A loader returns (questions, task, fixture, workers
+# cap); task(question, db) returns whether the question was answered, and the
+# fixture is also what answers are scored against.
+def _plain():
+    import main
+    return main.questions, lambda q, _db: main.run_question(0, q)[0] == "valid", main.conn, None
+
+
+def _retry():
+    import test
+    return test.queries, lambda q, db: test.execute_with_retry(q, db=db), test.conn, None
+
+
+def _tools():
+    import test2
+    return test2.queries, lambda q, db: test2.execute_with_retry(q, db=db), test2.conn, None
+
+
+def _cot():
+    import cot
+    return cot.queries, lambda q, db: cot.generate_sql_with_tools(q, db.cursor()), cot.conn, None
+
+
+def _langchain():
+    import final
+    return final.queries, lambda q, db: final.run_sql_and_handle(q, db).get("error") is None, final.conn, None
+
+
+STRATEGIES = {"plain": _plain, "retry": _retry, "tools": _tools, "cot": _cot, "langchain": _langchain}
+
+
+def percentile(values, p):
+    # Linear interpolation between closest ranks, as numpy's default.
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(traces, wall_seconds=None):
+    latencies = [t.latency for t in traces]
+    ttfts = [t.ttft for t in traces]
+    scored = [t for t in traces if t.correct is not None]
+    n = len(traces) or 1
+    return {
+        "questions": len(traces),
+        "succeeded": sum(t.success for t in traces),
+        "success_rate": round(sum(t.success for t in traces) / n, 4),
+        "scored": len(scored),
+        "correct": sum(t.correct for t in scored),
+        "execution_accuracy": round(sum(t.correct for t in scored) / len(scored), 4) if scored else None,
+        "errors": sum(t.error is not None for t in traces),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "llm_calls": sum(t.llm_calls for t in traces),
+        "retries": sum(t.retries for t in traces),
+        "tokens_in": sum(t.tokens_in for t in traces),
+        "tokens_out": sum(t.tokens_out for t in traces),
+        "sql_seconds": sum(t.sql_seconds for t in traces),
+        "wall_seconds": wall_seconds,
+    }
+
+
+def score(traces, fixture, gold, workers=None):
+    # Fills in Trace.correct by running gold and generated SQL side by side.
+    results = evaluate(((t.question, gold.get(t.question), t.sql) for t in traces), fixture, workers)
+    for trace, result in zip(traces, results):
+        trace.correct = result["correct"]
+        if trace.error is None and result["correct"] is False:
+            trace.error = result["error"]
+
+
+def run_strategy(name, workers, gold=None):
+    questions, task, fixture, cap = STRATEGIES[name]()
+    if cap is not None:
+        workers = min(workers, cap)
+
+    def measured(question, db):
+        trace = Trace(strategy=name, question=question)
+        start = time.perf_counter()
+        with tracing(trace):
+            try:
+                trace.success = bool(task(question, db))
+            except Exception as e:
+                trace.error = f"{type(e).__name__}: {e}"
+            finally:
+                trace.latency = time.perf_counter() - start
+        return trace
+
+    start = time.perf_counter()
+    traces = run_concurrently(measured, questions, workers, fixture=fixture)
+    wall_seconds = time.perf_counter() - start
+    if gold is not None:
+        score(traces, fixture, gold)
+    return traces, summarize(traces, wall_seconds)
+
+
+def write_results(path, run):
+    # .csv gets one row per question; anything else gets the whole run as JSON.
+    if path.endswith(".csv"):
+        rows = [
+            {**asdict(t), "label": run["label"]}
+            for traces in run["traces"].values() for t in traces
+        ]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["label"])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as f:
+            json.dump(
+                {**run, "traces": {name: [asdict(t) for t in traces] for name, traces in run["traces"].items()}},
+                f, indent=2,
+            )
+
+
+def _fmt(value, unit="s"):
+    return "-" if value is None else f"{value:.2f}{unit}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run benchmark strategies and record latency and token metrics.")
+    parser.add_argument("strategies", nargs="*", default=["retry"], help=f"any of {', '.join(STRATEGIES)} (default retry)")
+    parser.add_argument("--output", "-o", action="append", default=[], help="write results to a .json or .csv file (repeatable)")
+    parser.add_argument("--label", default="", help="free-form tag stored with the results, e.g. the model version")
+    parser.add_argument("--cassette", choices=cassette.MODES, help="record/replay model calls (default: LLM_CASSETTE_MODE)")
+    parser.add_argument("--no-score", action="store_true", help="skip execution-accuracy scoring against gold SQL")
+    add_worker_args(parser)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.strategies if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategy: {', '.join(unknown)}")
+
+    if args.cassette:
+        cassette.configure(mode=args.cassette)
+    gold = None if args.no_score else load_gold()
+    run = {"label": args.label, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "workers": args.workers, "summary": {}, "traces": {}}
+    for name in args.strategies:
+        logger.info(f"Running strategy {name} on {args.workers} workers")
+        traces, summary = run_strategy(name, args.workers, gold)
+        run["traces"][name] = traces
+        run["summary"][name] = summary
+
+    print(f"\n{'strategy':<10} {'ran':>7} {'exec acc':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft50':>8} {'calls':>6} {'retries':>8} {'tok in':>8} {'tok out':>8} {'sql':>8}")
+    for name, s in run["summary"].items():
+        print(
+            f"{name:<10} {s['succeeded']:>3}/{s['questions']:<3} {s['correct']:>4}/{s['scored']:<4} {_fmt(s['latency_p50']):>8} {_fmt(s['latency_p95']):>8} "
+            f"{_fmt(s['latency_p99']):>8} {_fmt(s['ttft_p50']):>8} {s['llm_calls']:>6} {s['retries']:>8} "
+            f"{s['tokens_in']:>8} {s['tokens_out']:>8} {_fmt(s['sql_seconds']):>8}"
+        )
+    if cassette.current().mode != "off":
+        print(f"Cassette: {cassette.current().hits} replayed, {cassette.current().misses} missed")
+    for path in args.output:
+        write_results(path, run)
+        print(f"Results written to {path}")
+    return run
+
+
+if __name__ == "__main__":
+    main()
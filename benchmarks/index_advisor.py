@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from ingest import quote_identifier
+from pagination import FETCH_BATCH_ROWS
+from sql_tokens import identifier_name, tokenize
+
+# Most indexes the advisor will create, across all tables.
+INDEX_BUDGET = int(os.environ.get("INDEX_BUDGET", "8"))
+# Times a column must show up in a filter or join on a scanned table first.
+MIN_HITS = int(os.environ.get("INDEX_MIN_HITS", "3"))
+
+_COMPARISONS = {"=", "==", "<", ">", "<=", ">=", "!=", "<>", "IN", "BETWEEN", "LIKE", "GLOB", "IS"}
+# EXPLAIN QUERY PLAN rows for a full scan, or for a temporary index SQLite
+# builds on every run because no real one exists.
+_PLAN_SCAN = re.compile(r"^(?:SCAN|SEARCH) (\S+)(?: USING AUTOMATIC)?")
+# Words that can follow a table name without being its alias.
+_KEYWORDS = {"WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "ON", "USING",
+             "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW"}
+
+
+def _aliases(tokens, table_names):
+    # Maps every name the query uses for a table (its own, or an alias after
+    # FROM/JOIN or in a comma join) to the table, all lowercased.
+    known = {name.lower(): name for name in table_names}
+    aliases = {}
+    for i, (kind, text) in enumerate(tokens[:-1]):
+        if text.upper() not in ("FROM", "JOIN") and text != ",":
+            continue
+        name = identifier_name(*tokens[i + 1])
+        if name not in known:
+            continue
+        aliases[name] = known[name]
+        j = i + 2
+        if j < len(tokens) and tokens[j][1].upper() == "AS":
+            j += 1
+        if j < len(tokens) and tokens[j][0] in ("word", "quoted") and tokens[j][1].upper() not in _KEYWORDS:
+            aliases[identifier_name(*tokens[j])] = known[name]
+    return aliases
+
+
+def _filtered_columns(tokens):
+    # (qualifier or None, column) for identifiers compared against something,
+    # e.g. `a.x = b.x`, `price > 10`, `name IN (...)`.
+    found = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind not in ("word", "quoted") or text.upper() in _COMPARISONS or text.upper() == "NOT":
+            continue
+        after = tokens[i + 1][1].upper() if i + 1 < len(tokens) else ""
+        if after == ".":
+            continue
+        qualifier = None
+        start = i
+        if i > 1 and tokens[i - 1][1] == ".":
+            qualifier = identifier_name(*tokens[i - 2])
+            start = i - 2
+        before = tokens[start - 1][1].upper() if start > 0 else ""
+        if before in _COMPARISONS or after in _COMPARISONS or after == "NOT":
+            found.append((qualifier, identifier_name(kind, text)))
+    return found
+
+
+class IndexAdvisor:
+    # Watches the generated SQL that actually runs, and for columns that keep
+    # being filtered or joined on while their table is scanned, builds an
+    # index in the background and times the query that triggered it before
+    # and after.
+    def __init__(self, pool, governor=None, budget=INDEX_BUDGET, min_hits=MIN_HITS):
+        self.pool = pool
+        self.governor = governor
+        self.budget = budget
+        self.min_hits = min_hits
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._built = []
+        # Indexes that measured no faster and were dropped again
+        self._rejected = []
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+
+    def record(self, sql, schema):
+        # `schema` maps table name -> column names. Returns immediately; the
+        # plan is looked at on the advisor's own thread.
+        if len(self._built) < self.budget:
+            self._executor.submit(self._analyse, sql, schema)
+
+    def _analyse(self, sql, schema):
+        try:
+            tokens = list(tokenize(sql))
+            aliases = _aliases(tokens, schema)
+            with self.pool.reader() as conn:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            scanned = {}
+            for *_, detail in plan:
+                match = _PLAN_SCAN.match(detail)
+                if match and (detail.startswith("SCAN") or "AUTOMATIC" in detail):
+                    name = identifier_name("word", match.group(1))
+                    if name in aliases:
+                        scanned[name] = aliases[name]
+            if not scanned:
+                return
+
+            candidates = set()
+            for qualifier, column in _filtered_columns(tokens):
+                tables = [scanned[qualifier]] if qualifier in scanned else [] if qualifier else scanned.values()
+                for table in tables:
+                    columns = {c.lower(): c for c in schema.get(table, [])}
+                    if column in columns:
+                        candidates.add((table, columns[column]))
+
+            ready = []
+            with self._lock:
+                for candidate in candidates:
+                    self._hits[candidate] += 1
+                    if self._hits[candidate] >= self.min_hits and candidate not in self._pending:
+                        ready.append(candidate)
+            for table, column in ready:
+                self._build(table, column, sql)
+        except Exception as e:
+            print(f"[INDEX] Could not analyse query: {e}")
+
+    def _time(self, sql):
+        with self.pool.reader() as conn:
+            start = time.perf_counter()
+            if self.governor is None:
+                conn.execute(sql).fetchall()
+            else:
+                # In batches, so the row cap stops the query before the
+                # whole result is held in memory
+                with self.governor.guard(conn) as budget:
+                    cursor = conn.execute(sql)
+                    while rows := cursor.fetchmany(FETCH_BATCH_ROWS):
+                        budget.add_result(len(rows), 0)
+            return time.perf_counter() - start
+
+    def _build(self, table, column, sql):
+        with self._lock:
+            if len(self._built) >= self.budget:
+                return
+            self._pending.add((table, column))
+        name = re.sub(r"\W", "_", f"idx_{table}_{column}")
+        try:
+            before = self._time(sql)
+            start = time.perf_counter()
+            with self.pool.writer() as conn:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} ({quote_identifier(column)})")
+                conn.commit()
+            build_seconds = time.perf_counter() - start
+            after = self._time(sql)
+            if after >= before:
+                # Not worth a place in the budget; the column stays pending
+                # so it isn't built again on the next hit.
+                with self.pool.writer() as conn:
+                    conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(name)}")
+                    conn.commit()
+        except Exception as e:
+            print(f"[INDEX] Failed to build {name}: {e}")
+            return
+        entry = {
+            "index": name,
+            "table": table,
+            "column": column,
+            "hits": self._hits[(table, column)],
+            "query": sql,
+            "build_seconds": round(build_seconds, 4),
+            "before_ms": round(before * 1000, 3),
+            "after_ms": round(after * 1000, 3),
+            "speedup": round(before / after, 2) if after > 0 else None,
+        }
+        if after >= before:
+            with self._lock:
+                self._rejected.append(entry)
+            print(f"[INDEX] Dropped {name} on {table}({column}): {entry['before_ms']}ms -> {entry['after_ms']}ms")
+            return
+        with self._lock:
+            self._built.append(entry)
+        print(f"[INDEX] Built {name} on {table}({column}): {entry['before_ms']}ms -> {entry['after_ms']}ms")
+
+    def report(self):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "built": list(self._built),
+                "rejected": list(self._rejected),
+                "watching": [
+                    {"table": table, "column": column, "hits": hits}
+                    for (table, column), hits in self._hits.most_common()
+                    if (table, column) not in self._pending
+                ],
+            }
+
+    def reset(self):
+        # The tables, and so their indexes, are gone.
+        with self._lock:
+            self._hits.clear()
+            self._built.clear()
+            self._rejected.clear()
+            self._pending.clear()
+
+    def wait(self):
+        # Blocks until everything recorded so far has been analysed.
+        self._executor.submit(lambda: None).result()
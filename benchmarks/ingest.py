@@ -0,0 +1,405 @@
+import io
+import json
+import sqlite3
+import time
+from decimal import Decimal, InvalidOperation
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+from pandas.tseries.api import guess_datetime_format
+
+# Rows per chunk read from the upload. Each chunk is inserted in its own
+# transaction, so this bounds both peak memory and the size of a transaction.
+CHUNK_ROWS = 50_000
+# Characters read from a JSON upload per refill of the decode buffer.
+JSON_READ_SIZE = 1 << 20
+# STRICT tables reject values that do not match the declared column type.
+STRICT_TABLES = sqlite3.sqlite_version_info >= (3, 37, 0)
+
+# Column kinds, narrowest first within each family. Dates are stored as ISO
+# 8601 text, which sorts correctly and works with SQLite's date functions.
+_NUMERIC = ["BOOLEAN", "INTEGER", "REAL"]
+_TEMPORAL = ["DATE", "DATETIME"]
+_STORAGE = {"BOOLEAN": "INTEGER", "INTEGER": "INTEGER", "REAL": "REAL", "DATE": "TEXT", "DATETIME": "TEXT", "TEXT": "TEXT"}
+_BOOLEAN_WORDS = ("true", "false", "yes", "no")
+# SQLite INTEGER is a signed 64-bit integer
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+# Decimal digits a float64 always reads back unchanged
+_FLOAT_DIGITS = 15
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _storage_type(kind: str) -> str:
+    if kind == "NULL":
+        return "ANY" if STRICT_TABLES else ""
+    return _STORAGE[kind]
+
+
+def _widen(a: str, b: str) -> str:
+    # Narrowest kind that holds values of both `a` and `b`.
+    if a == "NULL":
+        return b
+    if b == "NULL":
+        return a
+    for family in (_NUMERIC, _TEMPORAL):
+        if a in family and b in family:
+            return family[max(family.index(a), family.index(b))]
+    return "TEXT"
+
+
+def _fits_int64(numbers):
+    return bool(numbers.min() >= _INT64_MIN and numbers.max() <= _INT64_MAX)
+
+
+def _exact_float(value):
+    try:
+        return Decimal(value if isinstance(value, str) else str(value)) == Decimal(repr(float(value)))
+    except (InvalidOperation, ValueError, OverflowError):
+        return False
+
+
+def _exact_as_float(values):
+    # Whether every value reads back as the same number from a float64, so
+    # storing the column as REAL loses no digits: 0.1 and 1.50 do, a
+    # 25-digit identifier does not.
+    if infer_dtype(values, skipna=True) == "floating":
+        return True
+    # No more digits than characters, so short values need no checking
+    long = values[(values.astype(str).str.len() > _FLOAT_DIGITS).to_numpy()]
+    return all(_exact_float(v) for v in long)
+
+
+def _numeric_kind(values, numbers):
+    # INTEGER if every value fits SQLite's integers, REAL if every value
+    # survives a float64, else None and the column stays TEXT
+    if infer_dtype(numbers, skipna=True) == "integer" and _fits_int64(numbers):
+        return "INTEGER"
+    if _exact_as_float(values):
+        return "REAL"
+    return None
+
+
+def infer_column(series):
+    # Returns (kind, datetime format) for a column, using vectorized checks
+    # over its non-null values.
+    values = series.dropna()
+    if values.empty:
+        return "NULL", None
+    inferred = infer_dtype(values, skipna=True)
+    if inferred == "boolean":
+        return "BOOLEAN", None
+    if inferred in ("integer", "floating", "mixed-integer-float", "decimal"):
+        return _numeric_kind(values, values) or "TEXT", None
+    if inferred in ("datetime64", "datetime", "date"):
+        dt = pd.to_datetime(values)
+        return ("DATE" if (dt == dt.dt.normalize()).all() else "DATETIME"), None
+    if inferred != "string":
+        return "TEXT", None
+
+    values = values.str.strip()
+    if values.str.lower().isin(_BOOLEAN_WORDS).all():
+        return "BOOLEAN", None
+    # Codes such as zip codes or phone numbers lose their leading zeros as numbers
+    if not values.str.match(r"[-+]?0\d").any():
+        numbers = pd.to_numeric(values, errors="coerce")
+        if numbers.notna().all():
+            kind = _numeric_kind(values, numbers)
+            if kind is not None:
+                return kind, None
+    if values.str.contains(r"\d[-/.: ]\d|\d [A-Za-z]{3}").all():
+        # The format guessed from the first value, else any mix of ISO 8601
+        for fmt in (guess_datetime_format(values.iloc[0]), "ISO8601"):
+            if fmt is None:
+                continue
+            dt = pd.to_datetime(values, format=fmt, errors="coerce")
+            if dt.notna().all():
+                has_time = any(code in fmt for code in ("%H", "%I", "%M", "%S"))
+                return ("DATETIME" if has_time or not (dt == dt.dt.normalize()).all() else "DATE"), fmt
+    return "TEXT", None
+
+
+def _coerce(series, kind, fmt=None):
+    # Converts a column to values of `kind` as an object array of Python
+    # values and None, or returns None if some value does not fit.
+    mask = series.notna().to_numpy()
+    values = series[mask]
+    out = np.full(len(series), None, dtype=object)
+    if not len(values):
+        out[mask] = values.to_numpy(dtype=object)
+        return out
+    inferred = infer_dtype(values, skipna=True)
+
+    if kind == "NULL":
+        return None
+    if kind == "BOOLEAN":
+        if inferred == "boolean":
+            converted = values.astype(int)
+        elif inferred == "string":
+            lowered = values.str.strip().str.lower()
+            if not lowered.isin(_BOOLEAN_WORDS).all():
+                return None
+            converted = lowered.isin(("true", "yes")).astype(int)
+        else:
+            return None
+    elif kind in ("INTEGER", "REAL"):
+        if inferred == "string" and values.str.strip().str.match(r"[-+]?0\d").any():
+            return None
+        converted = pd.to_numeric(values.str.strip() if inferred == "string" else values, errors="coerce")
+        if converted.isna().any():
+            return None
+        if kind == "INTEGER":
+            if not pd.api.types.is_integer_dtype(converted) and not pd.api.types.is_bool_dtype(converted):
+                return None
+            if not _fits_int64(converted):
+                return None
+            converted = converted.astype("int64")
+        else:
+            if not _exact_as_float(values.str.strip() if inferred == "string" else values):
+                return None
+            converted = converted.astype("float64")
+    elif kind in _TEMPORAL:
+        if inferred == "string":
+            converted = pd.to_datetime(values.str.strip(), format=fmt or "ISO8601", errors="coerce")
+        elif inferred in ("datetime64", "datetime", "date"):
+            converted = pd.to_datetime(values)
+        else:
+            return None
+        if converted.isna().any():
+            return None
+        if converted.dt.tz is not None:
+            converted = converted.dt.tz_convert("UTC").dt.tz_localize(None)
+        if kind == "DATE":
+            if not (converted == converted.dt.normalize()).all():
+                return None
+            converted = converted.dt.strftime("%Y-%m-%d")
+        else:
+            converted = converted.dt.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        if inferred in ("datetime64", "datetime"):
+            converted = pd.to_datetime(values).dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif inferred == "string":
+            converted = values
+        else:
+            converted = values.map(lambda v: json.dumps(v) if isinstance(v, (dict, list)) else str(v))
+
+    out[mask] = converted.to_numpy(dtype=object)
+    return out
+
+
+def _table_sql(table_name, specs):
+    columns = ", ".join(
+        f"{quote_identifier(col)} {_storage_type(kind)}".rstrip() for col, (kind, _) in specs.items()
+    )
+    return f"CREATE TABLE {quote_identifier(table_name)} ({columns}){' STRICT' if STRICT_TABLES else ''}"
+
+
+def _create_table(conn, table_name, specs):
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+    conn.execute(_table_sql(table_name, specs))
+
+
+def _insert_sql(table_name, columns):
+    names = ", ".join(quote_identifier(col) for col in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return f"INSERT INTO {quote_identifier(table_name)} ({names}) VALUES ({placeholders})"
+
+
+def _rebuild_table(conn, table_name, specs, previous, raw_table):
+    # Changes column types after a later chunk did not fit the types
+    # inferred from the first one. Rows already inserted are converted in
+    # SQLite rather than read back; a column that became TEXT takes the
+    # source text kept in `raw_table`, so earlier rows read as they were
+    # uploaded rather than as a cast of their converted value.
+    tmp = f"{table_name}__widen"
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(tmp)}")
+    conn.execute(_table_sql(tmp, specs))
+    select = []
+    for col, (kind, _) in specs.items():
+        before = previous[col][0]
+        name = quote_identifier(col)
+        if kind == "TEXT" and before != "TEXT":
+            select.append(f"r.{name}")
+        elif kind == "DATETIME" and before == "DATE":
+            select.append(f"datetime(t.{name})")
+        elif _storage_type(kind) not in ("", "ANY") and _storage_type(kind) != _storage_type(before):
+            select.append(f"CAST(t.{name} AS {_storage_type(kind)})")
+        else:
+            select.append(f"t.{name}")
+    conn.execute(
+        f"INSERT INTO {quote_identifier(tmp)} (rowid, {', '.join(quote_identifier(col) for col in specs)}) "
+        f"SELECT t.rowid, {', '.join(select)} FROM {quote_identifier(table_name)} t "
+        f"LEFT JOIN {quote_identifier(raw_table)} r ON r.rowid = t.rowid"
+    )
+    conn.execute(f"DROP TABLE {quote_identifier(table_name)}")
+    conn.execute(f"ALTER TABLE {quote_identifier(tmp)} RENAME TO {quote_identifier(table_name)}")
+
+
+def _stored_exact_as_float(conn, table_name, col):
+    # Whether the integers already inserted into `col` survive a cast to
+    # REAL; SQLite compares integers with reals exactly.
+    name = quote_identifier(col)
+    return conn.execute(
+        f"SELECT 1 FROM {quote_identifier(table_name)} WHERE {name} != CAST({name} AS REAL) LIMIT 1"
+    ).fetchone() is None
+
+
+def _chunk_columns(conn, df, specs, table_name):
+    # Coerces every column of a chunk, widening the types of columns that
+    # do not fit. Returns the columns and whether the table has to be rebuilt.
+    columns = []
+    rebuild = False
+    for col, (kind, fmt) in list(specs.items()):
+        values = _coerce(df[col], kind, fmt)
+        if values is None:
+            new_kind, new_fmt = infer_column(df[col])
+            widened = _widen(kind, new_kind)
+            values = _coerce(df[col], widened, new_fmt or fmt)
+            if (kind, widened) == ("INTEGER", "REAL") and not _stored_exact_as_float(conn, table_name, col):
+                values = None
+            if values is None:
+                widened, new_fmt = "TEXT", None
+                values = _coerce(df[col], widened)
+            print(f"[INGEST] {table_name}: widening {col} from {kind} to {widened}")
+            rebuild = rebuild or _storage_type(widened) != _storage_type(kind) or widened == "TEXT" or (
+                kind, widened) == ("DATE", "DATETIME")
+            specs[col] = (widened, new_fmt or fmt)
+        columns.append(values)
+    return columns, rebuild
+
+
+def _ingest_chunks(chunks, conn, table_name):
+    start = time.perf_counter()
+    total_rows = 0
+    specs = None
+    # Source text of the typed columns' values, row for row, kept until the
+    # upload is in for columns that have to be widened to TEXT later
+    raw_table = f"{table_name}__raw"
+
+    try:
+        for df in chunks:
+            added = []
+            if specs is None:
+                # Column types are inferred from the first chunk. Later chunks
+                # are coerced to them, widening a column if they do not fit.
+                specs = {str(col): infer_column(df[col]) for col in df.columns}
+                df.columns = list(specs)
+                _create_table(conn, table_name, specs)
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(raw_table)}")
+                conn.execute(f"CREATE TABLE {quote_identifier(raw_table)} ({', '.join(quote_identifier(col) for col in specs)})")
+                conn.commit()
+            else:
+                df.columns = [str(col) for col in df.columns]
+                # Keys that first show up in a later chunk of a JSON upload
+                # become new columns, empty for the rows before them
+                added = [col for col in df.columns if col not in specs]
+                for col in added:
+                    specs[col] = infer_column(df[col])
+                    print(f"[INGEST] {table_name}: adding column {col} as {specs[col][0]}")
+                df = df.reindex(columns=list(specs))
+
+            previous = dict(specs)
+            columns, rebuild = _chunk_columns(conn, df, specs, table_name)
+            empty = [None] * len(df)
+            raw = [
+                empty if kind == "TEXT" else _coerce(df[col], "TEXT")
+                for col, (kind, _) in specs.items()
+            ]
+            with conn:
+                for col in added:
+                    kind = _storage_type(previous[col][0])
+                    conn.execute(f"ALTER TABLE {quote_identifier(table_name)} ADD COLUMN {quote_identifier(col)} {kind}".rstrip())
+                    conn.execute(f"ALTER TABLE {quote_identifier(raw_table)} ADD COLUMN {quote_identifier(col)}")
+                if rebuild:
+                    _rebuild_table(conn, table_name, specs, previous, raw_table)
+                conn.executemany(_insert_sql(table_name, specs), zip(*columns))
+                conn.executemany(_insert_sql(raw_table, specs), zip(*raw))
+            total_rows += len(df)
+            print(f"[INGEST] {table_name}: {total_rows} rows inserted")
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(raw_table)}")
+        conn.commit()
+
+    if specs is None:
+        raise ValueError("Uploaded file contains no rows")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": total_rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed > 0 else None,
+        "types": {col: kind for col, (kind, _) in specs.items()},
+    }
+
+
+def iter_json_records(stream, read_size=JSON_READ_SIZE):
+    # Yields records from either a top-level JSON array or JSON lines without
+    # holding more than one read buffer plus one record in memory.
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+
+    while True:
+        # Skip whitespace and the separators between array elements.
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos = stream.read(read_size), 0
+            eof = not buf
+
+        if pos >= len(buf):
+            return
+
+        if in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buf[pos] == "]":
+            return
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        if not isinstance(record, dict):
+            raise ValueError("JSON upload must be an array of objects or JSON lines")
+        yield record
+        pos = end
+
+
+def _json_chunks(stream, chunk_rows):
+    # Each chunk has the keys of its own records as columns; keys new to a
+    # later chunk are added to the table by _ingest_chunks.
+    batch = []
+    for record in iter_json_records(stream):
+        batch.append(record)
+        if len(batch) >= chunk_rows:
+            yield pd.DataFrame(batch, dtype=object)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, dtype=object)
+
+
+def ingest_csv(stream, conn, table_name, chunk_rows=CHUNK_ROWS):
+    # Everything is read as text so types are inferred once, by infer_column,
+    # instead of per chunk by pandas.
+    return _ingest_chunks(pd.read_csv(stream, chunksize=chunk_rows, dtype=str), conn, table_name)
+
+
+def ingest_json(stream, conn, table_name, chunk_rows=CHUNK_ROWS):
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8")
+    return _ingest_chunks(_json_chunks(stream, chunk_rows), conn, table_name)
@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import os
+import httpx
+from ollama import AsyncClient, Client
+import cassette
+from batching import MicroBatcher
+from metrics import record_llm_call
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+MODEL_NAME = "text2sql"
+TIMEOUT_SECONDS = 60
+CONNECT_TIMEOUT_SECONDS = 5
+# Upper bound on concurrent requests to Ollama from this process.
+MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
+# Micro-batching window. Set OLLAMA_NUM_PARALLEL to the server's value so a
+# batch fills its parallel slots without queueing on the server.
+BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", str(MAX_WORKERS)))
+BATCH_WAIT_MS = float(os.getenv("LLM_BATCH_WAIT_MS", "10"))
+NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", str(MAX_WORKERS)))
+
+
+class LLMClient:
+    # One pooled HTTP session and one micro-batching scheduler, with its bounded
+    # executor, shared by every call instead of a client and pool per prompt.
+    def __init__(
+        self,
+        host=OLLAMA_HOST,
+        model=MODEL_NAME,
+        timeout=TIMEOUT_SECONDS,
+        max_workers=NUM_PARALLEL,
+        batch_size=BATCH_SIZE,
+        batch_wait_ms=BATCH_WAIT_MS,
+    ):
+        self.model = model
+        self.timeout = timeout
+        # The HTTP timeout is what actually frees a worker stuck on a hung
+        # request; the future timeout below only stops the caller waiting.
+        self._client = Client(
+            host=host,
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers),
+        )
+        self._batcher = MicroBatcher(
+            self.chat, max_batch_size=batch_size, max_wait=batch_wait_ms / 1000, parallel=max_workers
+        )
+
+    def chat(self, prompt, format=None, **kwargs):
+        return cassette.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            format=format,
+            client=self._client,
+            **kwargs,
+        )
+
+    def stream(self, prompt, format=None):
+        # Yields the reply text as the model generates it. Streams skip the
+        # batcher; each one holds its connection until the reply is done.
+        chunks = self.chat(prompt, format, stream=True)
+        try:
+            for chunk in chunks:
+                if chunk.done:
+                    record_llm_call(chunk)
+                if chunk.message.content:
+                    yield chunk.message.content
+        finally:
+            # Closing early, e.g. once the SQL has failed, stops the generation
+            chunks.close()
+
+    def submit(self, prompt, format=None):
+        return self._batcher.submit(prompt, format)
+
+    def chat_json(self, prompt, response_model, timeout=None):
+        timeout = timeout or self.timeout
+        future = self.submit(prompt, response_model.model_json_schema())
+        try:
+            response = future.result(timeout=timeout)
+        except (concurrent.futures.TimeoutError, httpx.TimeoutException):
+            # Drops the call if it is still queued behind other requests.
+            future.cancel()
+            raise TimeoutError(f"API call timed out after {timeout} seconds")
+        record_llm_call(response)
+        return response_model.model_validate_json(response.message.content)
+
+    def close(self):
+        self._batcher.close()
+        self._client._client.close()
+
+
+class AsyncLLMClient:
+    # asyncio counterpart of LLMClient. Waiting on the model costs no thread,
+    # and a timed-out call is cancelled along with its HTTP request.
+    def __init__(self, host=OLLAMA_HOST, model=MODEL_NAME, timeout=TIMEOUT_SECONDS, max_concurrency=NUM_PARALLEL):
+        self.model = model
+        self.timeout = timeout
+        self._client = AsyncClient(
+            host=host,
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        # Requests beyond this wait here rather than in the HTTP pool, so
+        # queueing time counts against the caller's timeout.
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def chat(self, prompt, format=None, **kwargs):
+        async with self._slots:
+            return await cassette.achat(
+                self._client,
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                format=format,
+                **kwargs,
+            )
+
+    async def stream(self, prompt, format=None):
+        async with self._slots:
+            chunks = await cassette.achat(
+                self._client,
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                format=format,
+                stream=True,
+            )
+            try:
+                async for chunk in chunks:
+                    if chunk.done:
+                        record_llm_call(chunk)
+                    if chunk.message.content:
+                        yield chunk.message.content
+            finally:
+                await chunks.aclose()
+
+    async def chat_json(self, prompt, response_model, timeout=None):
+        timeout = timeout or self.timeout
+        try:
+            response = await asyncio.wait_for(self.chat(prompt, response_model.model_json_schema()), timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            raise TimeoutError(f"API call timed out after {timeout} seconds")
+        record_llm_call(response)
+        return response_model.model_validate_json(response.message.content)
+
+    async def close(self):
+        await self._client._client.aclose()
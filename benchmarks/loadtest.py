@@ -0,0 +1,331 @@
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import requests
+from accuracy import load_gold
+from harness import percentile
+
+# Replays a mix of /query and /upload requests against api.py (or
+# async_api.py) and reports throughput, latency and errors per endpoint.
+#   --rps N          open loop: requests start on schedule whether or not
+#                    earlier ones finished, as independent users would
+#   --concurrency N  closed loop: N users, each sending its next request as
+#                    soon as the last one returns
+# With --serve the API runs in this process, and with --mock it talks to
+# mock_ollama instead of a real model, so what is left is our own code.
+
+DEFAULT_URL = "http://127.0.0.1:5000"
+TIMEOUT_SECONDS = 120
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+# Open-loop requests allowed in flight before new ones queue in the client.
+MAX_IN_FLIGHT = 512
+
+logger = logging.getLogger(__name__)
+
+_DEPARTMENTS = ["Engineering", "Sales", "Marketing", "Finance", "Support", "HR"]
+_NAMES = ["Alice", "Bob", "Carol", "Dan", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    # When the request was due, so open-loop latency includes any time it
+    # waited for a free client thread.
+    scheduled: float
+    latency: float
+    status: int = None
+    # None on success, otherwise one of the classes from classify()
+    error: str = None
+
+
+def employees_csv(rows, seed=0):
+    rng = random.Random(seed)
+    out = io.StringIO()
+    out.write("id,name,department,salary,hire_date,active\n")
+    for i in range(1, rows + 1):
+        out.write(
+            f"{i},{rng.choice(_NAMES)} {i},{rng.choice(_DEPARTMENTS)},{rng.randrange(30_000, 200_000)},"
+            f"20{rng.randrange(10, 25)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d},{rng.choice(['true', 'false'])}\n"
+        )
+    return out.getvalue().encode()
+
+
+def load_questions(path=None):
+    # A JSON list or dict (e.g. gold_sql.json, whose keys are questions), or
+    # one question per line. Defaults to the gold questions.
+    if path is None:
+        return list(load_gold())
+    with open(path) as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [line.strip() for line in text.splitlines() if line.strip()]
+    return list(data)
+
+
+def _error_class(text):
+    text = (text or "").lower()
+    if "database is locked" in text or "database table is locked" in text:
+        return "database_locked"
+    if "timed out" in text or "timeout" in text:
+        return "timeout"
+    return None
+
+
+def classify(response=None, exc=None):
+    # None for a good response, otherwise the error class to count it under.
+    if exc is not None:
+        if isinstance(exc, requests.Timeout):
+            return "timeout"
+        if isinstance(exc, requests.ConnectionError):
+            return "connection"
+        return type(exc).__name__
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    error = body.get("error")
+    if response.status_code >= 400:
+        return _error_class(error) or f"http_{response.status_code}"
+    if body.get("success") is False:
+        return body.get("error_type") or _error_class(error) or "query_failed"
+    return None
+
+
+class LoadTest:
+    def __init__(self, base_url=DEFAULT_URL, questions=None, upload_ratio=0.1, upload_rows=1000,
+                 unique=False, timeout=TIMEOUT_SECONDS, seed=0):
+        self.base_url = base_url.rstrip("/")
+        self.questions = questions or load_questions()
+        self.upload_ratio = upload_ratio
+        self.upload_rows = upload_rows
+        self.unique = unique
+        self.timeout = timeout
+        self.samples = []
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._samples_lock = threading.Lock()
+        self._local = threading.local()
+        self._sent = 0
+        self._upload_body = employees_csv(upload_rows, seed)
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _next(self):
+        # (endpoint, request kwargs), drawn from the mix
+        with self._rng_lock:
+            self._sent += 1
+            n = self._sent
+            upload = self._rng.random() < self.upload_ratio
+            question = self._rng.choice(self.questions)
+        if upload:
+            return "/upload", {"files": {"file": (f"load_{n}.csv", self._upload_body, "text/csv")}}
+        if self.unique:
+            # A number the query cache treats as a literal, so every request
+            # reaches the model.
+            question = f"{question} (request {n})"
+        return "/query", {"json": {"nl_query": question}}
+
+    def send(self, scheduled=None):
+        endpoint, kwargs = self._next()
+        scheduled = scheduled if scheduled is not None else time.perf_counter()
+        sample = Sample(endpoint=endpoint, scheduled=scheduled, latency=0.0)
+        try:
+            response = self._session().post(self.base_url + endpoint, timeout=self.timeout, **kwargs)
+            sample.status = response.status_code
+            sample.error = classify(response)
+        except Exception as e:
+            sample.error = classify(exc=e)
+        sample.latency = time.perf_counter() - scheduled
+        with self._samples_lock:
+            self.samples.append(sample)
+        return sample
+
+    def seed_table(self):
+        # /query needs something to ask about
+        response = requests.post(
+            self.base_url + "/upload",
+            files={"file": ("employees.csv", self._upload_body, "text/csv")},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["table_name"]
+
+    def run_rps(self, rps, duration, poisson=False):
+        # Open loop. Arrivals are evenly spaced, or exponential with --poisson.
+        arrivals = random.Random(self._rng.random())
+        start = time.perf_counter()
+        due = start
+        with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="load") as pool:
+            while due < start + duration:
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, due)
+                due += arrivals.expovariate(rps) if poisson else 1 / rps
+        return time.perf_counter() - start
+
+    def run_concurrency(self, users, duration=None, total=None):
+        # Closed loop, until `duration` seconds pass or `total` requests are sent.
+        start = time.perf_counter()
+        deadline = start + duration if duration else None
+        remaining = [total]
+        lock = threading.Lock()
+
+        def user():
+            while deadline is None or time.perf_counter() < deadline:
+                if total is not None:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                self.send()
+
+        threads = [threading.Thread(target=user, name=f"user-{i}") for i in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start
+
+
+def histogram(latencies):
+    counts = [0] * len(BUCKETS)
+    for value in latencies:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                counts[i] += 1
+                break
+    return [{"le": "+Inf" if bound == float("inf") else bound, "count": count} for bound, count in zip(BUCKETS, counts)]
+
+
+def summarize(samples, elapsed):
+    by_endpoint = defaultdict(list)
+    for s in samples:
+        by_endpoint[s.endpoint].append(s)
+    report = {}
+    for endpoint, group in sorted(by_endpoint.items()):
+        latencies = [s.latency for s in group]
+        ok = [s.latency for s in group if s.error is None]
+        errors = Counter(s.error for s in group if s.error is not None)
+        report[endpoint] = {
+            "requests": len(group),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(group), 4),
+            "errors": dict(errors.most_common()),
+            "throughput": round(len(ok) / elapsed, 2) if elapsed else None,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "latency_max": max(latencies),
+            "histogram": histogram(latencies),
+        }
+    return report
+
+
+def print_report(report, elapsed):
+    total = sum(r["requests"] for r in report.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f}/s offered)" if elapsed else "")
+    for endpoint, r in report.items():
+        print(
+            f"\n{endpoint}: {r['requests']} requests, {r['ok']} ok, {r['throughput']}/s, "
+            f"error rate {r['error_rate']:.1%}"
+        )
+        print(
+            f"  latency p50 {r['latency_p50']:.3f}s  p90 {r['latency_p90']:.3f}s  p95 {r['latency_p95']:.3f}s  "
+            f"p99 {r['latency_p99']:.3f}s  max {r['latency_max']:.3f}s"
+        )
+        for name, count in r["errors"].items():
+            print(f"  {name:<22} {count:>6}")
+        peak = max(b["count"] for b in r["histogram"]) or 1
+        for b in r["histogram"]:
+            if b["count"]:
+                label = b["le"] if b["le"] == "+Inf" else f"{b['le']}s"
+                print(f"  <= {label:>6} {b['count']:>6} {'#' * max(1, round(40 * b['count'] / peak))}")
+
+
+def serve_api(host="127.0.0.1", port=0):
+    # Runs api.py on a background thread and returns its base URL. Imported
+    # here so OLLAMA_HOST, set by --mock, is seen when api builds its client.
+    from werkzeug.serving import make_server
+    import api
+    api.clear_all_tables()
+    server = make_server(host, port, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True, name="api").start()
+    return f"http://{host}:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the /query and /upload endpoints.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rps", type=float, help="open loop: requests started per second")
+    mode.add_argument("--concurrency", type=int, help="closed loop: simultaneous users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run (default 30)")
+    parser.add_argument("--requests", type=int, help="with --concurrency, stop after this many requests instead")
+    parser.add_argument("--poisson", action="store_true", help="with --rps, exponential rather than even arrivals")
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"API base URL (default {DEFAULT_URL})")
+    parser.add_argument("--serve", action="store_true", help="run api.py in this process instead of using --url")
+    parser.add_argument("--mock", action="store_true", help="start mock_ollama and point the API at it (with --serve)")
+    parser.add_argument("--mock-ttft-ms", type=float, default=250.0)
+    parser.add_argument("--mock-tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--questions", help="question mix: JSON list/dict or one per line (default gold_sql.json)")
+    parser.add_argument("--upload-ratio", type=float, default=0.1, help="share of requests that are uploads (default 0.1)")
+    parser.add_argument("--upload-rows", type=int, default=1000, help="rows in each uploaded CSV (default 1000)")
+    parser.add_argument("--unique", action="store_true", help="make every question unique so none is served from the query cache")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_SECONDS, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o", help="write the report and raw samples to a JSON file")
+    args = parser.parse_args(argv)
+    if args.mock and not args.serve:
+        parser.error("--mock needs --serve; otherwise start mock_ollama.py and point the API's OLLAMA_HOST at it")
+
+    if args.mock:
+        from mock_ollama import MockOllama, start_server
+        mock = start_server(MockOllama(ttft_ms=args.mock_ttft_ms, tokens_per_sec=args.mock_tokens_per_sec, seed=args.seed))
+        os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{mock.server_port}"
+    url = serve_api() if args.serve else args.url
+
+    test = LoadTest(
+        url, load_questions(args.questions), upload_ratio=args.upload_ratio, upload_rows=args.upload_rows,
+        unique=args.unique, timeout=args.timeout, seed=args.seed,
+    )
+    table = test.seed_table()
+    logger.info(f"Seeded table {table}")
+    if args.rps:
+        elapsed = test.run_rps(args.rps, args.duration, poisson=args.poisson)
+    else:
+        elapsed = test.run_concurrency(args.concurrency, None if args.requests else args.duration, args.requests)
+
+    report = summarize(test.samples, elapsed)
+    print_report(report, elapsed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "mode": {"rps": args.rps, "concurrency": args.concurrency, "duration": args.duration, "requests": args.requests},
+                "elapsed": elapsed,
+                "report": report,
+                "samples": [s.__dict__ for s in test.samples],
+            }, f, indent=2, default=str)
+        print(f"\nResults written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
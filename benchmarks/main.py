@@ -1,9 +1,14 @@
-import requests
+import argparse
+import os
+import sqlite3
 import time
 import json
 import sqlparse
 import logging
 from jsonschema import validate, ValidationError
+from cassette import generate
+from metrics import record_llm_call, record_sql
+from runner import add_worker_args, run_concurrently
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -16,7 +21,7 @@ logging.basicConfig(
 )
 
 # --- Ollama Config ---
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = f"{os.getenv('OLLAMA_HOST', 'http://localhost:11434')}/api/generate"
 MODEL_NAME = "text2sql:latest"
 
 # --- Structured Output Schema ---
@@ -46,17 +51,46 @@ questions = [
 # --- Table Schema (used in prompt) ---
 TABLE_SCHEMA = "Employees(id INTEGER, name TEXT, salary DECIMAL, hire_date DATE, department TEXT)"
 
-# --- Stats Trackers ---
-durations = []
-valid_responses = 0
-invalid_json = 0
-invalid_sql = 0
-errors = 0
-
-logging.info(f"🚀 Starting structured benchmark on model: {MODEL_NAME}")
+# --- Fixture DB (only used to score the generated SQL against gold_sql.json) ---
+conn = sqlite3.connect(":memory:")
+conn.execute("CREATE TABLE Employees (id INTEGER PRIMARY KEY, name TEXT, salary DECIMAL, hire_date DATE, department TEXT)")
+conn.executemany(
+    "INSERT INTO Employees (name, salary, hire_date, department) VALUES (?, ?, ?, ?)",
+    [
+        ("Aaron Park", 98000, "2019-03-11", "Engineering"),
+        ("Beatriz Silva", 121000, "2018-07-02", "Engineering"),
+        ("Chen Wei", 87500, "2021-01-18", "Engineering"),
+        ("Dmitri Volkov", 143000, "2016-05-23", "Engineering"),
+        ("Alice Moreau", 76000, "2025-02-03", "Engineering"),
+        ("Farah Haddad", 112500, "2020-10-12", "Engineering"),
+        ("Gustavo Lima", 69000, "2025-09-15", "Engineering"),
+        ("Hana Sato", 104000, "2022-04-04", "Engineering"),
+        ("Ivan Petrov", 91000, "2023-06-26", "Engineering"),
+        ("Julia Novak", 133500, "2017-11-06", "Engineering"),
+        ("Kwame Mensah", 81500, "2024-12-09", "Engineering"),
+        ("Lena Fischer", 95500, "2026-01-12", "Engineering"),
+        ("Mateo Rossi", 62000, "2020-02-17", "Sales"),
+        ("Nadia Karim", 71500, "2022-08-29", "Sales"),
+        ("Omar Aziz", 58000, "2025-05-19", "Sales"),
+        ("Priya Nair", 84000, "2019-09-09", "Sales"),
+        ("Quinn Murphy", 66500, "2024-03-25", "Sales"),
+        ("Arjun Mehta", 73000, "2021-07-07", "Sales"),
+        ("Sofia Bianchi", 55000, "2026-04-20", "Sales"),
+        ("Tomasz Nowak", 64000, "2018-01-29", "Marketing"),
+        ("Uma Rao", 78500, "2023-10-16", "Marketing"),
+        ("Victor Hugo", 59500, "2025-11-24", "Marketing"),
+        ("Wen Li", 70500, "2020-06-08", "Marketing"),
+        ("Ximena Cruz", 52000, "2024-08-05", "HR"),
+        ("Yusuf Demir", 61000, "2019-12-02", "HR"),
+        ("Zoe Adams", 67500, "2022-02-14", "HR"),
+    ],
+)
+conn.commit()
 
-# --- Benchmark Loop ---
-for i, question in enumerate(questions, 1):
+# --- Single Question ---
+def run_question(i, question):
+    # Returns (outcome, duration) where outcome is one of
+    # "valid", "invalid_json", "invalid_sql" or "error".
     logging.info(f"\n[{i}] Processing question: {question}")
 
     # Prompt designed to produce structured JSON
@@ -74,24 +108,22 @@ Write a valid SQL query to answer the question: "{question}"
         "stream": False
     }
 
+    duration = None
     try:
         start_time = time.time()
-        res = requests.post(OLLAMA_URL, json=payload)
+        # Replayed from the cassette when LLM_CASSETTE_MODE allows it
+        body = generate(OLLAMA_URL, payload)
         duration = time.time() - start_time
-        durations.append(duration)
 
-        logging.debug(f"[{i}] Raw response: {res.status_code}")
-        res.raise_for_status()
-
-        response = res.json().get("response", "")
+        record_llm_call(body)
+        response = body.get("response", "")
         logging.debug(f"[{i}] Raw model output: {response}")
 
         try:
             response_json = json.loads(response)
         except json.JSONDecodeError:
             logging.error(f"[{i}] ❌ Failed to decode response as JSON.")
-            invalid_json += 1
-            continue
+            return "invalid_json", duration
 
         # Validate JSON against schema
         try:
@@ -99,35 +131,53 @@ Write a valid SQL query to answer the question: "{question}"
         except ValidationError as ve:
             logging.error(f"[{i}] ❌ Response did not match schema.\n{json.dumps(response_json, indent=2)}")
             logging.debug(f"[{i}] Schema validation error: {ve}")
-            invalid_json += 1
-            continue
+            return "invalid_json", duration
 
         # Check SQL validity (basic check)
         sql_query = response_json["query"]
+        record_sql(sql_query)
         parsed = sqlparse.parse(sql_query)
         if not parsed or not sql_query.strip().lower().startswith("select"):
             logging.warning(f"[{i}] ⚠️ SQL might be invalid or unsupported:\n{sql_query}")
-            invalid_sql += 1
+            outcome = "invalid_sql"
         else:
-            valid_responses += 1
+            outcome = "valid"
 
         logging.info(f"[{i}] ✅ Valid response in {duration:.2f}s")
         logging.debug(f"[{i}] SQL Query:\n{sql_query}")
-        logging.debug(f"[{i}] Explanation:\n{response_json['explanation']}")
+        logging.debug(f"[{i}] Explanation:\n{response_json.get('explanation')}")
+        return outcome, duration
 
     except Exception as e:
         logging.exception(f"[{i}] ❌ Request failed.")
-        errors += 1
-
-# --- Summary Report ---
-total = len(questions)
-logging.info("\n=== 🧾 Final Benchmark Report ===")
-logging.info(f"Total Queries             : {total}")
-logging.info(f"✅ Valid Structured Output : {valid_responses}")
-logging.info(f"❌ Invalid JSON Structure  : {invalid_json}")
-logging.info(f"⚠️ Potential SQL Issues     : {invalid_sql}")
-logging.info(f"❌ Request Failures        : {errors}")
-logging.info(f"⏱️ Avg Response Time       : {sum(durations)/total:.2f}s")
-logging.info(f"⏱️ Fastest                 : {min(durations):.2f}s")
-logging.info(f"⏱️ Slowest                 : {max(durations):.2f}s")
-
+        return "error", duration
+
+
+if __name__ == "__main__":
+    args = add_worker_args(argparse.ArgumentParser()).parse_args()
+    logging.info(f"🚀 Starting structured benchmark on model: {MODEL_NAME} ({args.workers} workers)")
+
+    # --- Benchmark Loop ---
+    wall_start = time.time()
+    results = run_concurrently(
+        lambda item, _db: run_question(*item), enumerate(questions, 1), args.workers
+    )
+    wall_time = time.time() - wall_start
+
+    # --- Stats ---
+    outcomes = [outcome for outcome, _ in results]
+    durations = [duration for _, duration in results if duration is not None]
+
+    # --- Summary Report ---
+    total = len(questions)
+    logging.info("\n=== 🧾 Final Benchmark Report ===")
+    logging.info(f"Total Queries             : {total}")
+    logging.info(f"✅ Valid Structured Output : {outcomes.count('valid')}")
+    logging.info(f"❌ Invalid JSON Structure  : {outcomes.count('invalid_json')}")
+    logging.info(f"⚠️ Potential SQL Issues     : {outcomes.count('invalid_sql')}")
+    logging.info(f"❌ Request Failures        : {outcomes.count('error')}")
+    if durations:
+        logging.info(f"⏱️ Avg Response Time       : {sum(durations)/len(durations):.2f}s")
+        logging.info(f"⏱️ Fastest                 : {min(durations):.2f}s")
+        logging.info(f"⏱️ Slowest                 : {max(durations):.2f}s")
+    logging.info(f"⏱️ Wall Time               : {wall_time:.2f}s")
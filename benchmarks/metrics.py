@@ -0,0 +1,95 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Per-question measurements, filled in by the strategies and the LLM client
+# while harness.py runs them. Outside a harness run every recorder is a no-op.
+
+# Ollama reports durations in nanoseconds.
+_NS = 1e9
+
+
+@dataclass
+class Trace:
+    # Everything measured for one question under one strategy.
+    strategy: str
+    question: str
+    # Whether the strategy reported success, e.g. its SQL ran without error
+    success: bool = False
+    # Whether the SQL's result matches the gold SQL's; None when unscored
+    correct: bool = None
+    sql: str = None
+    error: str = None
+    latency: float = 0.0
+    ttft: float = None
+    llm_calls: int = 0
+    retries: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    llm_seconds: float = 0.0
+    sql_seconds: float = 0.0
+
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def tracing(trace):
+    # Records into `trace` for the duration of the block, on this thread.
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def _field(response, name):
+    if isinstance(response, dict):
+        return response.get(name)
+    return getattr(response, name, None)
+
+
+def record_llm_call(response):
+    # Call with each Ollama response (an ollama response object or the JSON
+    # of /api/generate or /api/chat).
+    trace = _current.get()
+    if trace is None or response is None:
+        return
+    trace.llm_calls += 1
+    trace.tokens_in += _field(response, "prompt_eval_count") or 0
+    trace.tokens_out += _field(response, "eval_count") or 0
+    trace.llm_seconds += (_field(response, "total_duration") or 0) / _NS
+    if trace.ttft is None:
+        # Without streaming, the first token comes out once the model is
+        # loaded and the prompt evaluated.
+        load = _field(response, "load_duration")
+        prompt_eval = _field(response, "prompt_eval_duration")
+        if load is not None or prompt_eval is not None:
+            trace.ttft = ((load or 0) + (prompt_eval or 0)) / _NS
+
+
+def record_sql(sql):
+    # The answer to score is the last SQL a strategy produced.
+    trace = _current.get()
+    if trace is not None:
+        trace.sql = sql
+
+
+def record_retry():
+    trace = _current.get()
+    if trace is not None:
+        trace.retries += 1
+
+
+@contextmanager
+def timed_sql(sql=None):
+    if sql is not None:
+        record_sql(sql)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current.get()
+        if trace is not None:
+            trace.sql_seconds += time.perf_counter() - start
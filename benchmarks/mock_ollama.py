@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A stand-in for the parts of the Ollama API the benchmarks and api.py use:
+# POST /api/generate and /api/chat (with `format` and streaming), GET
+# /api/tags and /api/version. Answers come from recorded responses when the
+# prompt was recorded, otherwise they are generated to fit `format`. Timing
+# follows the configured distributions, seeded from the prompt, so the same
+# run gives the same answers and, nearly, the same latencies.
+
+DEFAULT_PORT = 11434
+TTFT_MS = 250.0
+# Spread of time to first token, as the sigma of a lognormal around TTFT_MS.
+TTFT_SIGMA = 0.3
+TOKENS_PER_SEC = 40.0
+# Relative spread of the per-token delay.
+TOKEN_JITTER = 0.2
+
+_TOKEN = re.compile(r"\w+|[^\w\s]|\s+")
+_FREE_TEXT = "SQL Query:\nSELECT 1\n\nExplanation:\nMock response from the local test server."
+
+
+def count_tokens(text):
+    # Rough, but stable: words and punctuation, not whitespace.
+    return sum(1 for t in _TOKEN.findall(text) if not t.isspace())
+
+
+def prompt_key(prompt):
+    return hashlib.sha1(prompt.encode()).hexdigest()
+
+
+def load_recordings(path):
+    # JSON lines of {"prompt": ..., "response": ...}; later lines win.
+    recordings = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                recordings[prompt_key(entry["prompt"])] = entry["response"]
+    return recordings
+
+
+def _resolve(schema, defs):
+    while "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    return schema
+
+
+def _optional_object(schema, defs):
+    # Optional nested objects, such as a tool call next to the SQL, are left
+    # out so the answer reads as a plain final answer.
+    options = [_resolve(s, defs) for s in schema.get("anyOf", schema.get("oneOf", [schema]))]
+    return any(s.get("type") == "null" for s in options) and any(
+        s.get("type", "object") == "object" for s in options if s.get("type") != "null"
+    )
+
+
+def example_for_schema(schema, name=None, defs=None):
+    # A small value that validates against `schema`, good enough for the
+    # pydantic models and JSON schemas the benchmarks pass as `format`.
+    defs = defs if defs is not None else schema.get("$defs", {})
+    schema = _resolve(schema, defs)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [_resolve(s, defs) for s in schema[key]]
+            non_null = [s for s in options if s.get("type") != "null"]
+            return example_for_schema((non_null or options)[0], name, defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        required = set(schema.get("required", []))
+        return {
+            prop: None if prop not in required and _optional_object(sub, defs) else example_for_schema(sub, prop, defs)
+            for prop, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return []
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.0
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    if name and name.lower() in ("sql", "query", "sql_query"):
+        return "SELECT 1"
+    if name and name.lower() == "explanation":
+        return "Mock response from the local test server."
+    return "mock"
+
+
+def synthesize(format):
+    if isinstance(format, dict):
+        return json.dumps(example_for_schema(format))
+    if format == "json":
+        return json.dumps({"query": "SELECT 1", "sql": "SELECT 1", "explanation": "Mock response from the local test server."})
+    return _FREE_TEXT
+
+
+class MockOllama:
+    def __init__(self, recordings=None, ttft_ms=TTFT_MS, ttft_sigma=TTFT_SIGMA,
+                 tokens_per_sec=TOKENS_PER_SEC, token_jitter=TOKEN_JITTER, seed=0):
+        self.recordings = recordings or {}
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.token_jitter = token_jitter
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def answer(self, prompt, format=None):
+        return self.recordings.get(prompt_key(prompt)) or synthesize(format)
+
+    def timings(self, prompt, n_tokens):
+        # (time to first token, delay before each later token) in seconds
+        rng = random.Random(f"{self.seed}:{prompt_key(prompt)}")
+        ttft = self.ttft_ms / 1000 * rng.lognormvariate(0, self.ttft_sigma) if self.ttft_ms else 0.0
+        step = 1 / self.tokens_per_sec if self.tokens_per_sec else 0.0
+        delays = [max(0.0, step * (1 + rng.uniform(-self.token_jitter, self.token_jitter))) for _ in range(max(0, n_tokens - 1))]
+        return ttft, delays
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _chunks(text):
+    # Streamed pieces, one per token including the whitespace before it.
+    pieces = []
+    for match in _TOKEN.finditer(text):
+        if match.group().isspace() and pieces:
+            pieces[-1] += match.group()
+        else:
+            pieces.append(match.group())
+    return pieces or [""]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "text2sql:latest", "model": "text2sql:latest", "size": 0}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-mock"})
+        elif self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json({"error": "not found"}, 404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json({"error": f"invalid JSON: {e}"}, 400)
+            return
+
+        is_chat = self.path == "/api/chat"
+        if is_chat:
+            messages = request.get("messages") or []
+            user = [m.get("content", "") for m in messages if m.get("role") == "user"]
+            prompt = user[-1] if user else ""
+        else:
+            prompt = request.get("prompt", "")
+
+        mock = self.mock
+        with mock._lock:
+            mock.requests += 1
+        text = mock.answer(prompt, request.get("format"))
+        pieces = _chunks(text)
+        ttft, delays = mock.timings(prompt, len(pieces))
+        prompt_tokens = count_tokens(prompt)
+        model = request.get("model", "text2sql")
+
+        def message(content, done):
+            base = {"model": model, "created_at": _now(), "done": done}
+            if is_chat:
+                base["message"] = {"role": "assistant", "content": content}
+            else:
+                base["response"] = content
+            return base
+
+        def final(content, started, first_token_at):
+            payload = message(content, True)
+            now = time.perf_counter()
+            payload.update({
+                "done_reason": "stop",
+                "total_duration": int((now - started) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((first_token_at - started) * 1e9),
+                "eval_count": len(pieces),
+                "eval_duration": int((now - first_token_at) * 1e9),
+            })
+            return payload
+
+        started = time.perf_counter()
+        # Ollama streams unless told not to
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(ttft)
+            first_token_at = time.perf_counter()
+            try:
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(delays[i - 1])
+                    self._write_chunk(json.dumps(message(piece, False)) + "\n")
+                self._write_chunk(json.dumps(final("", started, first_token_at)) + "\n")
+                self._write_chunk("")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        else:
+            time.sleep(ttft)
+            first_token_at = time.perf_counter()
+            time.sleep(sum(delays))
+            self._send_json(final(text, started, first_token_at))
+
+    def _write_chunk(self, data):
+        data = data.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_server(mock=None, host="127.0.0.1", port=0):
+    # Runs the server on a daemon thread; port 0 picks a free port. Returns
+    # the server, whose base URL is f"http://{host}:{server.server_port}".
+    mock = mock or MockOllama()
+    handler = type("MockHandler", (Handler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-ollama").start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama API, for offline benchmarks and load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--replay", help="JSON lines file of recorded {prompt, response} pairs")
+    parser.add_argument("--ttft-ms", type=float, default=TTFT_MS, help="median time to first token")
+    parser.add_argument("--ttft-sigma", type=float, default=TTFT_SIGMA, help="lognormal sigma of the time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=TOKENS_PER_SEC, help="generation speed, 0 for instant")
+    parser.add_argument("--token-jitter", type=float, default=TOKEN_JITTER, help="relative spread of the per-token delay")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    mock = MockOllama(
+        recordings=load_recordings(args.replay) if args.replay else None,
+        ttft_ms=args.ttft_ms, ttft_sigma=args.ttft_sigma,
+        tokens_per_sec=args.tokens_per_sec, token_jitter=args.token_jitter, seed=args.seed,
+    )
+    handler = type("MockHandler", (Handler,), {"mock": mock})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"[MOCK] Ollama stand-in on http://{args.host}:{args.port} ({len(mock.recordings)} recorded responses)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10_000
+# Rows pulled from SQLite per fetchmany() when skipping or streaming.
+FETCH_BATCH_ROWS = 1000
+
+# Tokens are signed so a client can page through SQL the service generated,
+# but not submit its own. They stop validating when the process restarts.
+_TOKEN_KEY = secrets.token_bytes(32)
+
+
+def parse_page_size(value):
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    page_size = int(value)
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return page_size
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(_TOKEN_KEY, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def encode_page_token(sql_query: str, offset: int, page_size: int) -> str:
+    payload = json.dumps({"sql": sql_query, "offset": offset, "size": page_size}, separators=(",", ":"))
+    payload = base64.urlsafe_b64encode(payload.encode()).decode()
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_page_token(token: str):
+    payload, _, signature = str(token).rpartition(".")
+    if not payload or not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("Invalid page token")
+    data = json.loads(base64.urlsafe_b64decode(payload))
+    return data["sql"], data["offset"], data["size"]
+
+
+def fetch_page(cursor, offset: int, page_size: int):
+    # Skips `offset` rows and returns (rows, has_more) for the next page,
+    # never holding more than one batch of rows in memory.
+    while offset > 0:
+        skipped = cursor.fetchmany(min(offset, FETCH_BATCH_ROWS))
+        if not skipped:
+            return [], False
+        offset -= len(skipped)
+    rows = cursor.fetchmany(page_size + 1)
+    return rows[:page_size], len(rows) > page_size
+
+
+def iter_ndjson(meta: dict, cursor, on_rows=None):
+    # One JSON document per line: `meta` plus the column names, one array per
+    # row, then a summary line with the row count. `on_rows(count, nbytes)` is
+    # called before each batch is sent and may raise to cut the stream short.
+    columns = [description[0] for description in cursor.description]
+    yield json.dumps({**meta, "columns": columns}) + "\n"
+    count = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+        if not rows:
+            break
+        count += len(rows)
+        chunk = "".join(json.dumps(row, default=str) + "\n" for row in rows)
+        if on_rows is not None:
+            on_rows(len(rows), len(chunk))
+        yield chunk
+    yield json.dumps({"done": True, "row_count": count}) + "\n"
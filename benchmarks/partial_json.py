@@ -0,0 +1,131 @@
+import json
+
+_WS = " \t\r\n"
+
+
+class FieldStream:
+    # Incremental parser for a JSON object arriving a few characters at a time,
+    # such as a structured reply streamed by the model. feed() returns events:
+    #   ("delta", field, text)   more of a top-level string field's value
+    #   ("field", field, value)  a top-level field is complete
+    #   ("done", None, fields)   the closing brace was read
+    # Non-string values (numbers, nested objects, ...) are only reported whole.
+    # Anything before the opening brace, e.g. a ```json fence, is skipped.
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._state = "start"
+        self._key = None
+        self._raw = []
+        self._value = []
+        self._escape = ""
+        self._high = ""
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text):
+        events = []
+        delta = []
+        for c in text:
+            state = self._state
+            if state == "string":
+                if self._escape:
+                    self._escape += c
+                    if self._escape[1] != "u" or len(self._escape) == 6:
+                        decoded = self._decode(self._escape)
+                        self._escape = ""
+                        self._value.append(decoded)
+                        delta.append(decoded)
+                elif c == "\\":
+                    self._escape = c
+                elif c == '"':
+                    if delta:
+                        events.append(("delta", self._key, "".join(delta)))
+                        delta = []
+                    self._finish(events, "".join(self._value))
+                    self._state = "after_value"
+                else:
+                    self._value.append(c)
+                    delta.append(c)
+            elif state == "start":
+                if c == "{":
+                    self._state = "key_or_end"
+            elif state == "key_or_end":
+                if c == '"':
+                    self._raw = []
+                    self._state = "key"
+                elif c == "}":
+                    self._close(events)
+            elif state == "key":
+                if c == '"' and not self._odd_backslashes():
+                    self._key = json.loads('"' + "".join(self._raw) + '"')
+                    self._state = "colon"
+                else:
+                    self._raw.append(c)
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+            elif state == "value":
+                if c in _WS:
+                    continue
+                if c == '"':
+                    self._value = []
+                    self._state = "string"
+                else:
+                    self._raw = [c]
+                    self._depth = 1 if c in "[{" else 0
+                    self._in_string = False
+                    self._state = "other"
+            elif state == "other":
+                if self._in_string:
+                    if c == '"' and not self._odd_backslashes():
+                        self._in_string = False
+                elif c == '"':
+                    self._in_string = True
+                elif c in "[{":
+                    self._depth += 1
+                elif c in "]}" and self._depth:
+                    self._depth -= 1
+                elif self._depth == 0 and c in ",}":
+                    self._finish(events, json.loads("".join(self._raw)))
+                    if c == "}":
+                        self._close(events)
+                    else:
+                        self._state = "key_or_end"
+                    continue
+                self._raw.append(c)
+            elif state == "after_value":
+                if c == ",":
+                    self._state = "key_or_end"
+                elif c == "}":
+                    self._close(events)
+            # "end": trailing text after the object is ignored
+        if delta:
+            events.append(("delta", self._key, "".join(delta)))
+        return events
+
+    def _odd_backslashes(self):
+        count = 0
+        for c in reversed(self._raw):
+            if c != "\\":
+                break
+            count += 1
+        return count % 2 == 1
+
+    def _decode(self, escape):
+        # A \uXXXX high surrogate is held back until its low half arrives.
+        text = json.loads(f'"{escape}"')
+        if self._high:
+            text, self._high = (self._high + text).encode("utf-16", "surrogatepass").decode("utf-16"), ""
+        elif "\ud800" <= text <= "\udbff":
+            self._high, text = text, ""
+        return text
+
+    def _finish(self, events, value):
+        self.fields[self._key] = value
+        events.append(("field", self._key, value))
+
+    def _close(self, events):
+        self.done = True
+        self._state = "end"
+        events.append(("done", None, self.fields))
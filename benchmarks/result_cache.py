@@ -0,0 +1,85 @@
+import sys
+import threading
+from collections import OrderedDict
+from sql_tokens import tokenize
+
+MAX_BYTES = 64 * 1024 * 1024
+# Results of queries using these can change without any table being written.
+_VOLATILE = frozenset({"random", "randomblob", "current_date", "current_time", "current_timestamp", "changes", "last_insert_rowid", "total_changes"})
+
+
+def _volatile(sql) -> bool:
+    for kind, text in tokenize(sql):
+        if kind == "word" and text.lower() in _VOLATILE:
+            return True
+        # date('now'), datetime('now', '-1 day'), ...
+        if kind == "string" and text.lower() == "'now'":
+            return True
+    return False
+
+
+def estimate_size(rows) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class ResultCache:
+    # Byte-budgeted LRU of query results keyed by the SQL text and the current
+    # version of every table it reads. Writing a table bumps its version, which
+    # drops every cached result that depends on it.
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+
+    def cacheable(self, sql, tables):
+        return bool(tables) and not _volatile(sql)
+
+    def key(self, sql, tables):
+        # Take the key before running the query, so a result computed while a
+        # table was being replaced is stored under the old, dead version.
+        with self._lock:
+            return sql.strip(), tuple((t, self._versions.get(t, 0)) for t in tables)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            for key in [k for k in self._entries if any(t == table for t, _ in k[1])]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            # Versions keep counting so no old key can become valid again.
+            for table in self._versions:
+                self._versions[table] += 1
+            self._entries.clear()
+            self._bytes = 0
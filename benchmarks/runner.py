@@ -0,0 +1,74 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Questions in flight at once. Each one spends nearly all its time waiting
+# on the model, so threads are enough; match OLLAMA_NUM_PARALLEL to keep
+# every server slot busy.
+DEFAULT_WORKERS = int(os.environ.get("BENCH_WORKERS", os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+
+logger = logging.getLogger(__name__)
+
+
+def add_worker_args(parser):
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"questions to run concurrently (default {DEFAULT_WORKERS})",
+    )
+    return parser
+
+
+def snapshot(conn) -> bytes:
+    # The whole fixture database as bytes, to hand to each worker.
+    return conn.serialize()
+
+
+def open_copy(image: bytes):
+    # A private in-memory database with the contents of `image`.
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.deserialize(image)
+    return conn
+
+
+def run_concurrently(task, items, workers=DEFAULT_WORKERS, fixture=None):
+    # Calls task(item, db) for every item on `workers` threads and returns the
+    # results in the order of `items`, however they finish. With a `fixture`
+    # connection each worker thread gets its own in-memory copy of it as `db`,
+    # reset to the fixture before every item, so a question never sees
+    # another one's writes or locks and results don't depend on scheduling.
+    items = list(items)
+    image = snapshot(fixture) if fixture is not None else None
+    local = threading.local()
+    copies = []
+    copies_lock = threading.Lock()
+
+    def db():
+        if image is None:
+            return None
+        if not hasattr(local, "conn"):
+            local.conn = open_copy(image)
+            with copies_lock:
+                copies.append(local.conn)
+        else:
+            local.conn.deserialize(image)
+        return local.conn
+
+    def run(index, item):
+        start = time.perf_counter()
+        result = task(item, db())
+        logger.info(f"[runner] {index + 1}/{len(items)} done in {time.perf_counter() - start:.2f}s")
+        return result
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bench") as pool:
+            futures = [pool.submit(run, i, item) for i, item in enumerate(items)]
+            results = [future.result() for future in futures]
+    finally:
+        for conn in copies:
+            conn.close()
+    logger.info(f"[runner] {len(items)} items on {workers} workers in {time.perf_counter() - start:.2f}s")
+    return results
@@ -0,0 +1,42 @@
+import threading
+
+
+def schema_version(cursor):
+    # schema_version changes on any CREATE/DROP/ALTER, data_version on commits
+    # from other connections and total_changes on writes through this one.
+    cursor.execute("PRAGMA schema_version")
+    schema = cursor.fetchone()[0]
+    cursor.execute("PRAGMA data_version")
+    data = cursor.fetchone()[0]
+    return schema, data, cursor.connection.total_changes
+
+
+class SchemaCache:
+    # Caches a prompt context string built by `build(cursor, *args)`.
+    # With a cursor the entry is revalidated against the database version,
+    # without one it is only dropped by an explicit invalidate().
+    def __init__(self, build):
+        self._build = build
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get(self, cursor=None, *args):
+        version = schema_version(cursor) if cursor is not None else None
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(args)
+        if entry is not None and entry[0] == (generation, version):
+            return entry[1]
+
+        value = self._build(cursor, *args)
+        with self._lock:
+            # Don't store a value built from state that was invalidated meanwhile.
+            if generation == self._generation:
+                self._entries[args] = ((generation, version), value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -0,0 +1,231 @@
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from ingest import quote_identifier
+
+# Schema linking: ranks tables and columns against a question so the prompt
+# only carries the part of a wide database the question is about. An inverted
+# index maps words from table names, column names and sampled text values to
+# the columns they came from; a question scores every column through the
+# words it shares with it, weighted by how rare each word is in the schema.
+
+# Tables kept in a prompt, before the ones needed to join them are added
+TOP_TABLES = 4
+# Columns listed per table; keys and matched columns go first
+MAX_COLUMNS = 16
+# Rows read per table for its values
+SAMPLE_ROWS = 200
+# Text values longer than this many words are prose, not names or categories
+MAX_VALUE_WORDS = 3
+# Shortest word matched by prefix, so "hired" finds hire_date and "sales"
+# finds salesperson_id, but "id" matches nothing by accident
+MIN_PREFIX = 4
+PREFIX_WEIGHT = 0.6
+TABLE_WEIGHT = 3.0
+COLUMN_WEIGHT = 2.0
+VALUE_WEIGHT = 1.0
+
+# Letters only: numbers in a question are limits and literals, not names
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+")
+_STOPWORDS = frozenset({
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "with", "and", "or", "is", "are", "was", "were",
+    "be", "been", "has", "have", "had", "do", "does", "did", "not", "no", "all", "any", "each", "every",
+    "which", "what", "who", "whom", "whose", "that", "this", "these", "those", "their", "them", "they", "it",
+    "its", "me", "my", "show", "list", "find", "get", "give", "return", "display", "how", "many", "much",
+    "more", "most", "less", "least", "than", "at", "from", "as", "only", "also", "both", "along", "per", "yet",
+})
+# Key columns by name: customer_id, CustomerId, CustomerID, but not paid or valid
+_KEY_COLUMN = re.compile(r"(?:_id|_ID|[a-z]I[dD])$")
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def words(text):
+    # Lowercased, stemmed words, with snake_case and CamelCase split apart:
+    # "OrderDetails" -> ["order", "detail"], "hire_date" -> ["hire", "date"]
+    return [_stem(w.lower()) for w in _WORD.findall(str(text))]
+
+
+def question_words(question):
+    return {w for w in words(question) if w not in _STOPWORDS}
+
+
+class SchemaIndex:
+    # `tables` maps each table to its columns in order, `values` maps
+    # (table, column) to sampled values and `foreign_keys` lists
+    # (table, column, referenced table) triples.
+    def __init__(self, tables, values=None, foreign_keys=()):
+        self.tables = {table: list(columns) for table, columns in tables.items()}
+        self.edges = defaultdict(set)
+        # (table, column) -> the table it refers to
+        self.references = {}
+        # word -> {(table, column or None): weight}
+        postings = defaultdict(dict)
+
+        def post(word, key, weight):
+            postings[word][key] = max(postings[word].get(key, 0.0), weight)
+
+        for table, columns in self.tables.items():
+            for word in words(table) + [table.lower()]:
+                post(word, (table, None), TABLE_WEIGHT)
+            for column in columns:
+                for word in words(column) + [column.lower()]:
+                    post(word, (table, column), COLUMN_WEIGHT)
+        for (table, column), sample in (values or {}).items():
+            for value in sample:
+                if isinstance(value, str) and len(value.split()) <= MAX_VALUE_WORDS:
+                    for word in words(value):
+                        post(word, (table, column), VALUE_WEIGHT)
+
+        for table, column, target in foreign_keys:
+            if table in self.tables and target in self.tables:
+                self.references[(table, column)] = target
+                self._connect(table, target)
+        # Uploaded files carry no foreign keys, so columns such as
+        # customer_id that appear in several tables are taken as join keys.
+        by_key = defaultdict(list)
+        for table, columns in self.tables.items():
+            for column in columns:
+                if _KEY_COLUMN.search(column):
+                    by_key[column.lower()].append(table)
+        for shared in by_key.values():
+            for table in shared:
+                for other in shared:
+                    if other != table:
+                        self._connect(table, other)
+
+        self._postings = dict(postings)
+        self._words = sorted(self._postings)
+        columns = sum(len(columns) + 1 for columns in self.tables.values())
+        self._idf = {word: math.log(1 + columns / len(keys)) for word, keys in self._postings.items()}
+
+    def _connect(self, table, other):
+        self.edges[table].add(other)
+        self.edges[other].add(table)
+
+    @classmethod
+    def from_connection(cls, conn, tables=None, sample_rows=SAMPLE_ROWS):
+        # Index of `tables` (default: every table) as they are in `conn`,
+        # with values from the first `sample_rows` rows of each.
+        cursor = conn.cursor()
+        if tables is None:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            tables = [row[0] for row in cursor.fetchall()]
+        columns = {}
+        values = {}
+        foreign_keys = []
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({quote_identifier(table)})")
+            columns[table] = [row[1] for row in cursor.fetchall()]
+            cursor.execute(f"PRAGMA foreign_key_list({quote_identifier(table)})")
+            foreign_keys.extend((table, row[3], row[2]) for row in cursor.fetchall())
+            cursor.execute(f"SELECT * FROM {quote_identifier(table)} LIMIT {int(sample_rows)}")
+            rows = cursor.fetchall()
+            for i, column in enumerate(columns[table]):
+                values[(table, column)] = {row[i] for row in rows if isinstance(row[i], str)}
+        return cls(columns, values, foreign_keys)
+
+    def _matches(self, word):
+        # (index word, weight) for the word itself and for words one of
+        # which starts the other
+        found = []
+        if word in self._postings:
+            found.append((word, 1.0))
+        if len(word) >= MIN_PREFIX:
+            i = bisect_left(self._words, word)
+            while i < len(self._words) and self._words[i].startswith(word):
+                if self._words[i] != word:
+                    found.append((self._words[i], PREFIX_WEIGHT))
+                i += 1
+            for n in range(MIN_PREFIX, len(word)):
+                if word[:n] in self._postings:
+                    found.append((word[:n], PREFIX_WEIGHT))
+        return found
+
+    def rank(self, question):
+        # ({table: score}, {(table, column): score}) for every table and
+        # column that shares a word with the question
+        table_scores = defaultdict(float)
+        column_scores = defaultdict(float)
+        for word in question_words(question):
+            hits = {}
+            for match, weight in self._matches(word):
+                for key, source in self._postings[match].items():
+                    score = weight * source * self._idf[match]
+                    hits[key] = max(hits.get(key, 0.0), score)
+            for (table, column), score in hits.items():
+                table_scores[table] += score
+                if column is not None:
+                    column_scores[(table, column)] += score
+        return dict(table_scores), dict(column_scores)
+
+    def _bridges(self, table, chosen):
+        neighbours = sorted(self.edges.get(table, set()) & chosen)
+        return any(b not in self.edges[a] for i, a in enumerate(neighbours) for b in neighbours[i + 1:])
+
+    def _path(self, start, goal):
+        # Shortest chain of joins from `start` to `goal`, as a list of tables
+        previous = {start: None}
+        frontier = [start]
+        while frontier and goal not in previous:
+            following = []
+            for table in frontier:
+                for other in sorted(self.edges.get(table, ())):
+                    if other not in previous:
+                        previous[other] = table
+                        following.append(other)
+            frontier = following
+        if goal not in previous:
+            return []
+        path = [goal]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        return path
+
+    def link(self, question, top_tables=TOP_TABLES, max_columns=MAX_COLUMNS, include=()):
+        # {table: [columns]} for the prompt, in schema order. The best
+        # `top_tables` tables and those in `include` are kept, along with the
+        # tables their matched foreign keys point to and the tables that join
+        # them together. With no more tables than that, or nothing matching
+        # at all, nothing is left out.
+        table_scores, column_scores = self.rank(question)
+        include = [table for table in include if table in self.tables]
+        if len(self.tables) <= top_tables or not (table_scores or include):
+            chosen = set(self.tables)
+        else:
+            ranked = sorted(table_scores, key=lambda table: -table_scores[table]) or include
+            chosen = set(ranked[:top_tables]) | set(include)
+            for (table, column), target in self.references.items():
+                if table in chosen and (table, column) in column_scores:
+                    chosen.add(target)
+            # Tables that join two chosen ones that don't join each other,
+            # such as order lines between orders and products, then whatever
+            # still connects the rest to the best match.
+            chosen.update([
+                table for table in self.tables
+                if table not in chosen and self._bridges(table, chosen)
+            ])
+            first = ranked[0]
+            for table in sorted(chosen - {first}, key=lambda table: -table_scores.get(table, 0.0)):
+                chosen.update(self._path(first, table))
+
+        linked = {}
+        for table, columns in self.tables.items():
+            if table not in chosen:
+                continue
+            if len(columns) > max_columns:
+                def priority(i):
+                    column = columns[i]
+                    is_key = i == 0 or (table, column) in self.references or _KEY_COLUMN.search(column) is not None
+                    return (not is_key, -column_scores.get((table, column), 0.0), i)
+                kept = sorted(sorted(range(len(columns)), key=priority)[:max_columns])
+                columns = [columns[i] for i in kept]
+            linked[table] = columns
+        return linked
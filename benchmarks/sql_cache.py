@@ -0,0 +1,196 @@
+import functools
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Next to this module rather than in whatever directory the API starts from
+CACHE_PATH = os.environ.get("SQL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_cache.db"))
+MAX_ENTRIES = 10_000
+TTL_SECONDS = 7 * 24 * 3600
+# Minimum Jaccard similarity between question shingles for a fuzzy hit.
+SIMILARITY_THRESHOLD = 0.8
+
+_TOKEN = re.compile(r"'[^']*'|\"[^\"]*\"|[a-z0-9_]+(?:\.[0-9]+)?")
+# Filler words that never change the SQL a question needs.
+_STOPWORDS = frozenset({"a", "an", "the", "all", "me", "please", "can", "could", "you", "i", "want", "would", "like"})
+# Words a fuzzy hit may differ by: how a question is asked, not what it
+# asks for. Everything else, including negation and ordering words such as
+# "not", "without", "highest" and "before", has to match.
+_FILLER = _STOPWORDS | frozenset({
+    "show", "list", "display", "find", "get", "give", "return", "tell", "what", "which", "who", "are", "is",
+    "there", "of", "in", "that", "whose", "those", "these", "them", "us", "my", "our",
+})
+# Words that ask for the same thing, mapped to one spelling
+_SYNONYMS = {
+    "number": "count", "total": "sum", "mean": "average", "avg": "average",
+    "biggest": "largest", "sorted": "ordered", "employed": "hired",
+}
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(t for t in _TOKEN.findall(question.lower()) if t not in _STOPWORDS)
+
+
+def _shingles(normalized: str):
+    words = normalized.split()
+    return frozenset(words) | frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+def _content(normalized: str):
+    # The words a fuzzy hit must share with the cached question: "sales" is
+    # not "marketing", "hired" is not "fired" and "top 5" is not "top 10",
+    # however many other words the two questions share.
+    return frozenset(_SYNONYMS.get(w, w) for w in normalized.split() if w not in _FILLER)
+
+
+@functools.lru_cache(maxsize=32)
+def schema_fingerprint(schema_hint: str) -> str:
+    return hashlib.sha1(schema_hint.encode()).hexdigest()[:16]
+
+
+class QueryCache:
+    # Two-tier NL -> SQL cache. Tier one is an exact match on the normalized
+    # question and schema fingerprint; tier two is a shingle-similarity match
+    # over past questions asked against the same schema. Entries are evicted
+    # LRU beyond `max_entries` or after `ttl` seconds, and written through to
+    # a SQLite file so the cache survives restarts.
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # (fingerprint, shingle) -> keys of entries containing it
+        self._index = {}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    explanation TEXT,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._load()
+
+    def _key(self, normalized, fingerprint):
+        return hashlib.sha1(f"{fingerprint}\0{normalized}".encode()).hexdigest()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM query_cache WHERE created < ?", (cutoff,))
+        rows = self._db.execute(
+            "SELECT key, fingerprint, question, sql, explanation, created FROM query_cache ORDER BY last_used"
+        ).fetchall()
+        for key, fingerprint, question, sql, explanation, created in rows[-self.max_entries:]:
+            self._insert(key, fingerprint, normalize_question(question), question, sql, explanation, created)
+        self._db.commit()
+
+    def _insert(self, key, fingerprint, normalized, question, sql, explanation, created):
+        entry = {
+            "fingerprint": fingerprint,
+            "question": question,
+            "sql": sql,
+            "explanation": explanation,
+            "created": created,
+            "shingles": _shingles(normalized),
+            "content": _content(normalized),
+        }
+        self._entries[key] = entry
+        for shingle in entry["shingles"]:
+            self._index.setdefault((fingerprint, shingle), set()).add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for shingle in entry["shingles"]:
+            keys = self._index.get((entry["fingerprint"], shingle))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(entry["fingerprint"], shingle)]
+        if self._db is not None:
+            self._db.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def _similar(self, normalized, fingerprint):
+        shingles = _shingles(normalized)
+        content = _content(normalized)
+        overlap = {}
+        for shingle in shingles:
+            for key in self._index.get((fingerprint, shingle), ()):
+                overlap[key] = overlap.get(key, 0) + 1
+
+        best_key, best_score = None, self.threshold
+        for key, common in overlap.items():
+            entry = self._entries[key]
+            score = common / (len(shingles) + len(entry["shingles"]) - common)
+            if score >= best_score and entry["content"] == content:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+    def get(self, question, fingerprint):
+        normalized = normalize_question(question)
+        key = self._key(normalized, fingerprint)
+        with self._lock:
+            entry = self._fresh(key)
+            match, score = "exact", 1.0
+            if entry is None:
+                key, score = self._similar(normalized, fingerprint)
+                entry = self._fresh(key) if key is not None else None
+                match = "similar"
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute("UPDATE query_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+            return {
+                "key": key,
+                "match": match,
+                "score": round(score, 3),
+                "question": entry["question"],
+                "sql": entry["sql"],
+                "explanation": entry["explanation"],
+            }
+
+    def put(self, question, fingerprint, sql, explanation):
+        normalized = normalize_question(question)
+        key = self._key(normalized, fingerprint)
+        now = time.time()
+        with self._lock:
+            self._remove(key)
+            self._insert(key, fingerprint, normalized, question, sql, explanation, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, fingerprint, question, sql, explanation, now, now),
+                )
+                self._db.commit()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
@@ -0,0 +1,61 @@
+import re
+
+# A lexer that is just good enough to tell identifiers, literals, comments
+# and parameters apart in SQLite SQL, without a full parse.
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|`(?:[^`]|``)*`?|\[[^\]]*\]?)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>\?\d*|[:@$][A-Za-z_]\w*)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||<<|>>|[-+*/%<>=(),.;&|~])
+  | (?P<other>.)
+""", re.S | re.X)
+
+
+def tokenize(sql: str, skip=("ws", "comment")):
+    # Yields (kind, text) pairs, by default skipping whitespace and comments.
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind not in skip:
+            yield kind, match.group()
+
+
+def identifier_name(kind: str, text: str) -> str:
+    # Name an identifier token refers to, lowercased as SQLite compares them.
+    if kind == "quoted":
+        quote = text[0]
+        inner = text[1:-1] if len(text) > 1 else ""
+        if quote in "\"`":
+            inner = inner.replace(quote * 2, quote)
+        return inner.lower()
+    return text.lower()
+
+
+def identifiers(sql: str):
+    return {identifier_name(kind, text) for kind, text in tokenize(sql) if kind in ("word", "quoted")}
+
+
+def referenced_tables(sql: str, table_names):
+    # Conservative: any identifier that matches a known table name counts,
+    # even if it is really a column or alias with the same name.
+    known = {name.lower(): name for name in table_names}
+    return sorted(known[name] for name in identifiers(sql) if name in known)
+
+
+def rename_identifiers(sql: str, names) -> str:
+    # Rewrites every identifier that is a key of `names` (matched as SQLite
+    # compares them) to its value, leaving the rest of the SQL as written.
+    known = {name.lower(): new for name, new in names.items()}
+    out = []
+    for kind, text in tokenize(sql, skip=()):
+        new = known.get(identifier_name(kind, text)) if kind in ("word", "quoted") else None
+        if new is None:
+            out.append(text)
+        elif kind == "quoted":
+            out.append('"' + new.replace('"', '""') + '"')
+        else:
+            out.append(new)
+    return "".join(out)
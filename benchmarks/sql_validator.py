@@ -0,0 +1,123 @@
+import difflib
+import re
+import sqlite3
+from sql_tokens import identifier_name, tokenize
+
+# Keywords the model is known to mangle, and what it meant.
+KNOWN_TYPOS = {
+    "WHEREING": "WHERE",
+    "HAVINGING": "HAVING",
+    "SELCT": "SELECT",
+    "SLECT": "SELECT",
+    "GROUPBY": "GROUP BY",
+    "ORDERBY": "ORDER BY",
+}
+_FENCE = re.compile(r"^\s*```(?:sql|sqlite)?\s*(.*?)\s*```\s*$", re.S | re.I)
+_READ_ONLY_STARTS = ("SELECT", "WITH", "VALUES")
+
+
+class SQLValidationError(ValueError):
+    pass
+
+
+def repair_sql(sql: str) -> str:
+    # Strips markdown fences and trailing semicolons and fixes KNOWN_TYPOS,
+    # leaving string literals and quoted identifiers untouched.
+    fenced = _FENCE.match(sql)
+    if fenced:
+        sql = fenced.group(1)
+    parts = []
+    for kind, text in tokenize(sql, skip=()):
+        if kind == "word":
+            text = KNOWN_TYPOS.get(text.upper(), text)
+        parts.append(text)
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def _suggest(name, candidates):
+    # `candidates` maps lowercased names to how they are spelled in the schema
+    matches = difflib.get_close_matches(name, list(candidates), n=3)
+    return f" Did you mean: {', '.join(candidates[m] for m in matches)}?" if matches else ""
+
+
+def _cte_names(tokens):
+    # Names defined by `name AS (`, `name(columns) AS (` and the
+    # [NOT] MATERIALIZED variants.
+    ctes = set()
+    for i, (kind, text) in enumerate(tokens):
+        if kind not in ("word", "quoted"):
+            continue
+        j = i + 1
+        if j < len(tokens) and tokens[j][1] == "(":
+            depth = 0
+            while j < len(tokens):
+                depth += {"(": 1, ")": -1}.get(tokens[j][1], 0)
+                j += 1
+                if depth == 0:
+                    break
+        if j >= len(tokens) or tokens[j][1].upper() != "AS":
+            continue
+        j += 1
+        if j < len(tokens) and tokens[j][1].upper() == "NOT":
+            j += 1
+        if j < len(tokens) and tokens[j][1].upper() == "MATERIALIZED":
+            j += 1
+        if j < len(tokens) and tokens[j][1] == "(":
+            ctes.add(identifier_name(kind, text))
+    return ctes
+
+
+def _check_tables(tokens, schema):
+    # Tables named right after FROM/JOIN must exist, unless they are CTEs.
+    ctes = _cte_names(tokens)
+    known = {name.lower(): name for name in schema}
+    for i, (kind, text) in enumerate(tokens[:-1]):
+        if kind != "word" or text.upper() not in ("FROM", "JOIN"):
+            continue
+        j = i + 1
+        # schema.table: only the table part is checked
+        if j + 2 < len(tokens) and tokens[j + 1][1] == ".":
+            j += 2
+        next_kind, next_text = tokens[j]
+        if next_kind not in ("word", "quoted"):
+            continue
+        # Table-valued functions such as json_each(...)
+        if j + 1 < len(tokens) and tokens[j + 1][1] == "(":
+            continue
+        name = identifier_name(next_kind, next_text)
+        if name not in known and name not in ctes and not name.startswith("sqlite_"):
+            raise SQLValidationError(
+                f"no such table: {next_text}.{_suggest(name, known)} "
+                f"Available tables: {', '.join(schema)}"
+            )
+
+
+def validate_sql(conn, sql: str, schema=None, read_only=True) -> str:
+    # Checks generated SQL without running it and returns the repaired SQL.
+    # `schema` maps table name -> column names. Compilation goes through
+    # EXPLAIN, which prepares the statement but never touches table data.
+    sql = repair_sql(sql)
+    tokens = list(tokenize(sql))
+    if not tokens:
+        raise SQLValidationError("The SQL query is empty.")
+    if any(kind == "param" for kind, _ in tokens):
+        raise SQLValidationError("Do not use bindings or placeholders (?); write literal values into the query.")
+    if any(text == ";" for _, text in tokens):
+        raise SQLValidationError("Only a single SQL statement is allowed.")
+    if read_only and tokens[0][1].upper() not in _READ_ONLY_STARTS:
+        raise SQLValidationError("Only read-only SELECT queries are allowed.")
+    if schema is not None:
+        _check_tables(tokens, schema)
+
+    try:
+        conn.execute(f"EXPLAIN {sql}")
+    except sqlite3.Error as e:
+        message = str(e)
+        if schema is not None and message.startswith("no such column: "):
+            column = message.rsplit(".", 1)[-1].split(": ", 1)[-1].lower()
+            columns = {c.lower(): c for cols in schema.values() for c in cols}
+            suggestion = _suggest(column, columns)
+            if suggestion:
+                message += "." + suggestion
+        raise SQLValidationError(message) from e
+    return sql
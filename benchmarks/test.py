@@ -1,6 +1,10 @@
-import concurrent.futures
+import argparse
 import sqlite3
-from ollama import chat
+import time
+from metrics import record_retry, timed_sql
+from llm import LLMClient
+from runner import DEFAULT_WORKERS, add_worker_args, run_concurrently
+from sql_validator import validate_sql
 from pydantic import BaseModel
 from typing import Optional
 
@@ -136,15 +140,11 @@ class SQLResponse(BaseModel):
     sql: str
     explanation: str
 
-def _chat_call(prompt_content: str) -> SQLResponse:
-    response = chat(
-        messages=[{"role": "user", "content": prompt_content}],
-        model="text2sql",
-        format=SQLResponse.model_json_schema(),
-    )
-    return SQLResponse.model_validate_json(response.message.content)
-
 timeout_seconds = 60
+llm = LLMClient(timeout=timeout_seconds)
+
+def _chat_call(prompt_content: str) -> SQLResponse:
+    return llm.chat_json(prompt_content, SQLResponse)
 
 def generate_sql(
     nl_query: str,
@@ -220,29 +220,26 @@ OrderDetails (
             + "Please fix the SQL query accordingly, explain what you fixed, and output the corrected SQL."
         )
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(_chat_call, prompt_content)
-        try:
-            sql_response = future.result(timeout=timeout_seconds)
-            return sql_response
-        except concurrent.futures.TimeoutError:
-            raise TimeoutError(f"API call timed out after {timeout_seconds} seconds")
+    return _chat_call(prompt_content)
 
-def execute_with_retry(nl_query: str, max_retries=5) -> bool:
+def execute_with_retry(nl_query: str, max_retries=5, db=conn) -> bool:
     attempt = 0
     last_sql = None
     last_error = None
 
     while attempt < max_retries:
         attempt += 1
+        if attempt > 1:
+            record_retry()
         print(f"\n[Attempt {attempt}] Generating SQL for: {nl_query}")
         sql_response = generate_sql(nl_query, prev_sql=last_sql, prev_error=last_error)
-        sql_query = sql_response.sql.replace("WHEREING", "WHERE")
+        sql_query = sql_response.sql
         print("Generated SQL:", sql_query)
         print("Explanation:", sql_response.explanation)
         try:
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
+            sql_query = validate_sql(db, sql_query)
+            with timed_sql(sql_query):
+                rows = db.execute(sql_query).fetchall()
             print("✅ Query succeeded. Rows returned:", len(rows))
             return True
         except Exception as e:
@@ -253,13 +250,14 @@ def execute_with_retry(nl_query: str, max_retries=5) -> bool:
     print("❌ Failed after retries. Last error:", last_error)
     return False
 
-def benchmark(queries):
-    correct_count = 0
-    for q in queries:
-        if execute_with_retry(q):
-            correct_count += 1
+def benchmark(queries, workers=DEFAULT_WORKERS):
+    start = time.perf_counter()
+    results = run_concurrently(lambda q, db: execute_with_retry(q, db=db), queries, workers, fixture=conn)
+    for q, ok in zip(queries, results):
+        print(f"{'✅' if ok else '❌'} {q}")
+    correct_count = sum(results)
     total = len(queries)
-    print(f"\nBenchmark Score: {correct_count}/{total} correct")
+    print(f"\nBenchmark Score: {correct_count}/{total} correct ({time.perf_counter() - start:.1f}s, {workers} workers)")
 
 queries = [
     "Which product has the highest price?",
@@ -288,5 +286,6 @@ queries = [
 ]
 
 if __name__ == "__main__":
-    benchmark(queries)
+    args = add_worker_args(argparse.ArgumentParser()).parse_args()
+    benchmark(queries, args.workers)
 
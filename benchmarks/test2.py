@@ -1,6 +1,8 @@
 import sqlite3
-from ollama import chat
+from cassette import chat
 from pydantic import BaseModel
+from metrics import record_llm_call, record_retry, timed_sql
+from sql_validator import SQLValidationError, validate_sql as check_sql
 
 tools = [
     {
@@ -137,30 +139,28 @@ cursor.executemany(
 conn.commit()
 
 # --- TOOL FUNCTIONS ---
-def list_tables():
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    return [row[0] for row in cursor.fetchall()]
+# Each takes the connection to work on, so concurrent runs can each use
+# their own copy of the database.
+def list_tables(db=conn):
+    return [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()]
 
-def describe_table(table_name):
-    cursor.execute(f"PRAGMA table_info({table_name});")
-    return cursor.fetchall()
+def describe_table(table_name, db=conn):
+    return db.execute(f"PRAGMA table_info({table_name});").fetchall()
 
-def sample_rows(table_name, limit=5):
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit};")
-    return cursor.fetchall()
+def sample_rows(table_name, limit=5, db=conn):
+    return db.execute(f"SELECT * FROM {table_name} LIMIT {limit};").fetchall()
 
-def validate_sql(sql_query):
+def validate_sql(sql_query, db=conn):
+    # Compiles the query without running it
     try:
-        cursor.execute(sql_query)
-        _ = cursor.fetchall()
-        return {"valid": True, "rows": len(_)}
-    except Exception as e:
+        return {"valid": True, "sql": check_sql(db, sql_query)}
+    except SQLValidationError as e:
         return {"valid": False, "error": str(e)}
 
-def search_schema(keyword):
+def search_schema(keyword, db=conn):
     results = []
-    for table in list_tables():
-        cols = describe_table(table)
+    for table in list_tables(db):
+        cols = describe_table(table, db)
         matches = [c[1] for c in cols if keyword.lower() in c[1].lower()]
         if matches:
             results.append({table: matches})
@@ -172,8 +172,8 @@ class SQLResponse(BaseModel):
     explanation: str
 
 # --- SQL Generation ---
-def generate_sql(nl_query, prev_sql=None, error_message=None):
-    schema_hint = f"Database currently has these tables: {list_tables()}\n\n"
+def generate_sql(nl_query, prev_sql=None, error_message=None, db=conn):
+    schema_hint = f"Database currently has these tables: {list_tables(db)}\n\n"
 
     prompt = schema_hint + f"Convert the following request into SQL and explain it:\n{nl_query}"
 
@@ -189,6 +189,7 @@ def generate_sql(nl_query, prev_sql=None, error_message=None):
         model="text2sql",
         format=SQLResponse.model_json_schema(),
     )
+    record_llm_call(response)
 
     content = response.message.content
     if "CALL:" in content:
@@ -198,21 +199,21 @@ def generate_sql(nl_query, prev_sql=None, error_message=None):
         print(f"\n🔧 Tool call detected: {tool_call}")
 
         if tool_call.startswith("list_tables"):
-            result = list_tables()
+            result = list_tables(db)
         elif tool_call.startswith("describe_table"):
             table_name = tool_call.split("(")[1].split(")")[0].strip("'\" ")
-            result = describe_table(table_name)
+            result = describe_table(table_name, db)
         elif tool_call.startswith("sample_rows"):
             args = tool_call.split("(")[1].split(")")[0].split(",")
             table_name = args[0].strip("'\" ")
             limit = int(args[1]) if len(args) > 1 else 5
-            result = sample_rows(table_name, limit)
+            result = sample_rows(table_name, limit, db)
         elif tool_call.startswith("validate_sql"):
             sql_arg = tool_call.split("(")[1].split(")")[0].strip("'\" ")
-            result = validate_sql(sql_arg)
+            result = validate_sql(sql_arg, db)
         elif tool_call.startswith("search_schema"):
             keyword = tool_call.split("(")[1].split(")")[0].strip("'\" ")
-            result = search_schema(keyword)
+            result = search_schema(keyword, db)
         else:
             result = f"Unknown tool: {tool_call}"
         
@@ -220,12 +221,12 @@ def generate_sql(nl_query, prev_sql=None, error_message=None):
         print(f"📤 Tool result: {result}")
 
         # Re-run generation with tool output fed back
-        return generate_sql(nl_query, prev_sql, f"Tool {tool_call} returned: {result}")
+        return generate_sql(nl_query, prev_sql, f"Tool {tool_call} returned: {result}", db)
 
     return SQLResponse.model_validate_json(content)
 
 # --- Retry Execution ---
-def execute_with_retry(nl_query, max_retries=5):
+def execute_with_retry(nl_query, max_retries=5, db=conn):
     attempt = 0
     last_exception = None
     error_message = None
@@ -233,16 +234,19 @@ def execute_with_retry(nl_query, max_retries=5):
 
     while attempt < max_retries:
         attempt += 1
+        if attempt > 1:
+            record_retry()
         print(f"\n[Attempt {attempt}] Generating SQL for: {nl_query}")
-        sql_response = generate_sql(nl_query, prev_sql, error_message)
-        sql_query = sql_response.sql.strip().replace("WHEREING", "WHERE")
+        sql_response = generate_sql(nl_query, prev_sql, error_message, db)
+        sql_query = sql_response.sql.strip()
 
         print("Generated SQL:", sql_query)
         print("Explanation:", sql_response.explanation)
 
         try:
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
+            sql_query = check_sql(db, sql_query)
+            with timed_sql(sql_query):
+                rows = db.execute(sql_query).fetchall()
             print("✅ Query succeeded. Rows returned:", len(rows))
             return True
         except Exception as e:
@@ -273,5 +277,6 @@ queries = [
     "List the top 5 products with the highest stock quantity.",
 ]
 
-benchmark(queries)
+if __name__ == "__main__":
+    benchmark(queries)
 
@@ -0,0 +1,31 @@
+import io
+import sqlite3
+
+from ingest import ingest_csv, ingest_json
+
+
+def test_numbers_that_do_not_fit_stay_text():
+    conn = sqlite3.connect(":memory:")
+    csv = "id,code,price,qty\n12345678901234567890,1234567890123456789012345,1.5,3\n2,7,0.1,4\n"
+    info = ingest_csv(io.StringIO(csv), conn, "t")
+    assert info["types"] == {"id": "TEXT", "code": "TEXT", "price": "REAL", "qty": "INTEGER"}
+    assert conn.execute("SELECT id, code FROM t").fetchall() == [
+        ("12345678901234567890", "1234567890123456789012345"),
+        ("2", "7"),
+    ]
+
+
+def test_json_integers_over_int64_stay_text():
+    conn = sqlite3.connect(":memory:")
+    info = ingest_json(io.StringIO('[{"id": 12345678901234567890}, {"id": 3}]'), conn, "t")
+    assert info["types"] == {"id": "TEXT"}
+    assert conn.execute("SELECT id FROM t").fetchall() == [("12345678901234567890",), ("3",)]
+
+
+def test_widening_keeps_integers_a_float_would_round():
+    # 2**53 + 1 is an INTEGER in the first chunk; the REAL in the second
+    # would round it, so the column becomes TEXT instead
+    conn = sqlite3.connect(":memory:")
+    info = ingest_csv(io.StringIO("v\n9007199254740993\n2\n1.5\n"), conn, "t", chunk_rows=2)
+    assert info["types"] == {"v": "TEXT"}
+    assert conn.execute("SELECT v FROM t").fetchall() == [("9007199254740993",), ("2",), ("1.5",)]
@@ -0,0 +1,22 @@
+from schema_linker import SchemaIndex
+
+
+def test_id_suffixes_join_tables():
+    index = SchemaIndex({
+        "orders": ["order_id", "customer_id"],
+        "Customers": ["CustomerId", "name"],
+        "Invoices": ["InvoiceID", "CustomerId"],
+        "people": ["customer_id"],
+    })
+    assert index.edges["orders"] == {"people"}
+    assert index.edges["Customers"] == {"Invoices"}
+
+
+def test_words_ending_in_id_are_not_keys():
+    index = SchemaIndex({
+        "invoices": ["number", "paid"],
+        "payments": ["amount", "paid"],
+        "coupons": ["code", "valid", "void"],
+        "vouchers": ["code", "valid", "void"],
+    })
+    assert not index.edges
@@ -0,0 +1,48 @@
+from sql_cache import QueryCache
+
+
+def make_cache():
+    cache = QueryCache(path=None, threshold=0.5)
+    cache.put("list the employees in the sales department", "fp", "SELECT * FROM emp WHERE dept = 'sales'", "")
+    return cache
+
+
+LONG_QUESTION = "list the employees who work in the sales department and were hired in 2020 ordered by salary"
+
+
+def long_question_cache():
+    # The default threshold: one word in a long question barely moves the score
+    cache = QueryCache(path=None)
+    cache.put(LONG_QUESTION, "fp", "SELECT * FROM emp WHERE dept = 'sales' AND hired LIKE '2020%' ORDER BY salary", "")
+    return cache
+
+
+def test_similar_question_hits():
+    hit = make_cache().get("show the employees in the sales department", "fp")
+    assert hit is not None and hit["match"] == "similar"
+
+
+def test_negated_question_misses():
+    assert make_cache().get("list the employees not in the sales department", "fp") is None
+
+
+def test_changed_department_misses():
+    cache = long_question_cache()
+    assert cache.get(LONG_QUESTION.replace("sales", "marketing"), "fp") is None
+
+
+def test_changed_verb_misses():
+    cache = long_question_cache()
+    assert cache.get(LONG_QUESTION.replace("hired", "fired"), "fp") is None
+
+
+def test_rephrased_long_question_hits():
+    hit = long_question_cache().get(LONG_QUESTION.replace("list", "show"), "fp")
+    assert hit is not None and hit["match"] == "similar"
+
+
+def test_reversed_order_misses():
+    cache = QueryCache(path=None, threshold=0.5)
+    cache.put("products with the highest price", "fp", "SELECT * FROM p ORDER BY price DESC LIMIT 1", "")
+    assert cache.get("products with the lowest price", "fp") is None
+    assert cache.get("products with the highest price", "fp") is not None
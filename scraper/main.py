@@ -1,7 +1,13 @@
 from google import genai
-import csv
+import argparse
 import logging
-from src.generator import Generator
+import os
+import time
+from src.generator import BATCH_SIZE, WORKERS, Generator, Query, generate_batches
+from src.ratelimit import TokenBucket
+from src.validator import validate_example
+from src.dedup import NearDuplicateIndex
+from src.writer import DatasetWriter
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(levelname)s - %(message)s')
 
@@ -29,19 +35,52 @@ topics = [
     "Schema Inference and Multi-Table Reasoning"
 ]
 
-def main():
-    rows = 30
-    for topic in topics:
-        generator = Generator(topic)
-        data = generator.generate_data(num_rows=rows)
-        # print(data)
-
-        with open(f"data.csv", mode='a', newline='') as file:
-            writer = csv.writer(file)
-            # writer.writerow(["Instruction", "Query", "Table Schema", "Explanation"])
-            for item in data:
-                writer.writerow([item['instruction'], item['query'], item['table_schema'], item['explanation']])
-            logging.info(f"{rows} rows for topic '{topic}' written to data.csv")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate text-to-SQL examples for each topic with Gemini.")
+    parser.add_argument("--rows", type=int, default=30, help="examples per topic (default 30)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"requests in flight at once (default {WORKERS})")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("GEMINI_RPM", "60")), help="requests per minute across all workers (default GEMINI_RPM or 60)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"examples per request; more are split into parallel requests (default {BATCH_SIZE})")
+    parser.add_argument("--output", default="data.csv", help="a .csv or .jsonl file, or a .parquet directory; an unfinished run with the same output and settings is resumed (default data.csv)")
+    parser.add_argument("--near-duplicates", type=float, default=0.8, metavar="THRESHOLD", help="drop examples this similar to an earlier one (MinHash Jaccard estimate), 0 to keep them (default 0.8)")
+    parser.add_argument("--no-execute-check", action="store_true", help="keep examples whose query doesn't run on their table_schema")
+    parser.add_argument("--sequential", action="store_true", help="one topic and one request at a time, as before")
+    parser.add_argument("--fake", action="store_true", help="start a local stand-in for the Gemini API and use it")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fake:
+        from src.fake_gemini import start_server
+        server = start_server()
+        os.environ["GOOGLE_GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+        os.environ.setdefault("GEMINI_API_KEY", "fake")
+        logging.info(f"Using the fake Gemini API on port {server.server_port}")
+
+    batch_size = args.rows if args.sequential else args.batch_size
+    dedup = NearDuplicateIndex(args.near_duplicates) if args.near_duplicates else None
+    with DatasetWriter(args.output, Query, settings={"rows": args.rows, "batch_size": batch_size},
+                       dedup=dedup, check=None if args.no_execute_check else validate_example) as writer:
+        if args.sequential:
+            batches = (
+                (topic, 1, Generator(topic).request(args.rows))
+                for topic in topics if not writer.is_done(topic, 1)
+            )
+        else:
+            limiter = TokenBucket(args.rpm / 60) if args.rpm else None
+            batches = generate_batches(
+                topics, args.rows, workers=args.workers, limiter=limiter, batch_size=batch_size, skip=writer.is_done
+            )
+
+        start = time.time()
+        for topic, batch, data in batches:
+            written = writer.write_batch(topic, batch, data)
+            logging.info(f"{written} rows for topic '{topic}' (batch {batch}) written to {args.output}")
+        logging.info(
+            f"{writer.written} rows in {time.time() - start:.1f}s "
+            f"({writer.duplicates} duplicates, {writer.near_duplicates} near-duplicates, {writer.rejected} invalid rows "
+            f"and {writer.failed} that don't run dropped)"
+        )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+import argparse
+import itertools
+import logging
+import re
+import time
+import zlib
+from collections import defaultdict
+import numpy as np
+
+# Near-duplicate detection for generated examples with MinHash and
+# locality-sensitive hashing. Each example becomes a set of shingles (word
+# 3-grams of the instruction, token 3-grams of the normalized SQL) and a
+# MinHash signature estimating Jaccard similarity between those sets. LSH
+# splits signatures into bands and only compares examples that share a band,
+# so each new example costs about the same however many came before it.
+
+THRESHOLD = 0.8
+NUM_PERM = 128
+SHINGLE = 3
+# Rows hashed together by the command-line tool
+BATCH_ROWS = 1000
+
+_SHIFT = np.uint64(32)
+_WORD = re.compile(r"\w+")
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\w+|[^\w\s]")
+
+
+def sql_tokens(sql):
+    # Keywords and identifiers lowercased, whitespace and formatting ignored
+    return [t if t[0] in "'\"" else t.lower() for t in _SQL_TOKEN.findall(sql or "")]
+
+
+def _grams(tokens, n):
+    if len(tokens) <= n:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+
+def shingles(instruction, query, n=SHINGLE):
+    words = _WORD.findall((instruction or "").lower())
+    return {f"i:{g}" for g in _grams(words, n)} | {f"q:{g}" for g in _grams(sql_tokens(query), n)}
+
+
+def _bands(num_perm, threshold):
+    # (bands, rows per band) whose LSH S-curve turns at about `threshold`
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        # Odd multipliers, as multiply-shift hashing needs
+        self.a = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, feature_sets):
+        # One signature row per set of features, computed in a single pass
+        feature_sets = [features or {""} for features in feature_sets]
+        if not feature_sets:
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        lengths = np.fromiter((len(f) for f in feature_sets), dtype=np.int64, count=len(feature_sets))
+        # crc32 rather than hash(), which changes between processes
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode()) for features in feature_sets for f in features),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        # Multiply-shift hashing: the top 32 bits of a*x + b, wrapping at
+        # 2**64, with one (a, b) per permutation. Laid out permutation-major
+        # so each reduction runs over contiguous memory.
+        with np.errstate(over="ignore"):
+            permuted = (self.a[:, None] * hashes + self.b[:, None]) >> _SHIFT
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.minimum.reduceat(permuted, starts, axis=1).T.copy()
+
+    def signature(self, features):
+        return self.signatures([features])[0]
+
+
+class NearDuplicateIndex:
+    # Incremental index of the examples kept so far. add() says whether a new
+    # example is a near-duplicate of one of them (estimated Jaccard similarity
+    # of their shingles at or above `threshold`) and keeps it if not.
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, seed=1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands, self.rows = _bands(num_perm, threshold)
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures = []
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [signature[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def _match(self, signature, band_keys):
+        checked = set()
+        for bucket, band_key in zip(self._buckets, band_keys):
+            for i in bucket.get(band_key, ()):
+                if i in checked:
+                    continue
+                checked.add(i)
+                if np.count_nonzero(self._signatures[i] == signature) / len(signature) >= self.threshold:
+                    return self.keys[i]
+        return None
+
+    def _insert(self, signature, band_keys, key):
+        i = len(self.keys)
+        self._signatures.append(signature)
+        self.keys.append(key if key is not None else i)
+        for bucket, band_key in zip(self._buckets, band_keys):
+            bucket[band_key].append(i)
+
+    def add_many(self, rows, keys=None):
+        # For each row, in order, True if it was kept and False if it nearly
+        # duplicates an earlier row, including one earlier in `rows`.
+        signatures = self.hasher.signatures([shingles(row.get("instruction"), row.get("query")) for row in rows])
+        kept = []
+        for n, signature in enumerate(signatures):
+            band_keys = self._band_keys(signature)
+            if self._match(signature, band_keys) is not None:
+                kept.append(False)
+                continue
+            self._insert(signature, band_keys, keys[n] if keys is not None else None)
+            kept.append(True)
+        return kept
+
+    def add(self, row, key=None):
+        # True if the row was kept, False if it is a near-duplicate
+        return self.add_many([row], None if key is None else [key])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drop near-duplicate examples from a generated dataset.")
+    parser.add_argument("input", help="a .csv or .jsonl file, or a .parquet directory")
+    parser.add_argument("output", help="where to write the kept examples, in any of the same formats")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help=f"Jaccard similarity counted as a duplicate (default {THRESHOLD})")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM, help=f"MinHash permutations (default {NUM_PERM})")
+    args = parser.parse_args(argv)
+
+    from src.writer import read_rows, write_rows
+    index = NearDuplicateIndex(args.threshold, args.num_perm)
+    start = time.time()
+    total = 0
+    kept = []
+    rows = read_rows(args.input)
+    while batch := list(itertools.islice(rows, BATCH_ROWS)):
+        total += len(batch)
+        kept.extend(row for row, keep in zip(batch, index.add_many(batch)) if keep)
+    write_rows(args.output, kept)
+    logging.info(
+        f"Kept {len(kept)} of {total} rows ({total - len(kept)} near-duplicates) in {time.time() - start:.1f}s, "
+        f"{index.bands} bands of {index.rows}"
+    )
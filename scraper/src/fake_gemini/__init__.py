@@ -0,0 +1,166 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.ratelimit import TokenBucket
+
+# A local stand-in for the Gemini generateContent endpoint, so the generator
+# can be run and load-tested without an API key or quota. It answers with
+# made-up rows that fit the request's responseSchema, takes longer the more
+# rows are asked for, and enforces a requests-per-minute quota the way the
+# real API does: 429 RESOURCE_EXHAUSTED with a RetryInfo delay.
+#
+#   GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8085 GEMINI_API_KEY=fake python main.py
+
+DEFAULT_PORT = 8085
+LATENCY_MS = 400.0
+# Extra latency per generated row; long structured replies are what is slow.
+ROW_MS = 60.0
+RPM = 600.0
+ERROR_RATE = 0.0
+
+_ROWS = re.compile(r"generate (\d+)", re.I)
+_TOPIC = re.compile(r'topic: "([^"]*)"')
+
+
+def _value(name, schema, topic, n):
+    kind = schema.get("type", "STRING").upper()
+    if kind == "INTEGER":
+        return n
+    if kind == "NUMBER":
+        return float(n)
+    if kind == "BOOLEAN":
+        return n % 2 == 0
+    if name == "query":
+        return f"SELECT id, name FROM items_{n} WHERE id > {n} ORDER BY name LIMIT {n % 10 + 1};"
+    if name == "table_schema":
+        return f"CREATE TABLE items_{n} (id INTEGER PRIMARY KEY, name TEXT)"
+    return f"{name.replace('_', ' ').capitalize()} {n} for {topic}"
+
+
+def fake_rows(schema, count, topic="SQL", seed=0):
+    item = schema.get("items", schema)
+    properties = item.get("properties", {})
+    rng = random.Random(seed)
+    # One number per row, so its query runs on its table_schema
+    return [
+        {name: _value(name, sub, topic, n) for name, sub in properties.items()}
+        for n in (rng.randrange(1_000_000) for _ in range(count))
+    ]
+
+
+class FakeGemini:
+    def __init__(self, latency_ms=LATENCY_MS, row_ms=ROW_MS, rpm=RPM, error_rate=ERROR_RATE, seed=0):
+        self.latency_ms = latency_ms
+        self.row_ms = row_ms
+        self.quota = TokenBucket(rpm / 60, capacity=max(1.0, rpm / 60)) if rpm else None
+        self.error_rate = error_rate
+        self.requests = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def admit(self):
+        # None if the request may go ahead, else (status, error payload)
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+        if self.quota is not None:
+            wait = self.quota.try_acquire()
+            if wait:
+                with self._lock:
+                    self.throttled += 1
+                return 429, {
+                    "code": 429,
+                    "message": "Resource has been exhausted (e.g. check quota).",
+                    "status": "RESOURCE_EXHAUSTED",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{wait:.3f}s"}],
+                }
+        if fail:
+            return 503, {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"}
+        return None
+
+    def answer(self, request):
+        prompt = " ".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        config = request.get("generationConfig", {})
+        schema = config.get("responseSchema") or config.get("responseJsonSchema") or {"type": "ARRAY", "items": {}}
+        rows = int(m.group(1)) if (m := _ROWS.search(prompt)) else 1
+        topic = m.group(1) if (m := _TOPIC.search(prompt)) else "SQL"
+        with self._lock:
+            seed = self._rng.random()
+        time.sleep((self.latency_ms + self.row_ms * rows) / 1000)
+        text = json.dumps(fake_rows(schema, rows, topic, seed))
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(prompt) + len(text)) // 4,
+            },
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.split("?")[0].endswith(":generateContent"):
+            self._send_json({"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}}, 404)
+            return
+        rejected = self.fake.admit()
+        if rejected is not None:
+            status, error = rejected
+            self._send_json({"error": error}, status)
+            return
+        self._send_json(self.fake.answer(request))
+
+
+def start_server(fake=None, host="127.0.0.1", port=0):
+    # Serves on a daemon thread; port 0 picks a free port.
+    fake = fake or FakeGemini()
+    handler = type("FakeGeminiHandler", (Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-gemini").start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini generateContent API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="base latency of a request")
+    parser.add_argument("--row-ms", type=float, default=ROW_MS, help="extra latency per generated row")
+    parser.add_argument("--rpm", type=float, default=RPM, help="requests per minute before 429s, 0 for no quota")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="share of requests failing with 503")
+    args = parser.parse_args(argv)
+
+    fake = FakeGemini(args.latency_ms, args.row_ms, args.rpm, args.error_rate)
+    handler = type("FakeGeminiHandler", (Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Fake Gemini API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
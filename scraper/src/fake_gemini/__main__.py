@@ -0,0 +1,3 @@
+from src.fake_gemini import main
+
+main()
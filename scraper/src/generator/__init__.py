@@ -1,13 +1,45 @@
 from google import genai
+from google.genai import errors
 from dotenv import load_dotenv
 from google.genai import types
 from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.ratelimit import call_with_backoff
+import logging
 import os
 import json
+import threading
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Rows asked for in one request. Long structured replies are slow and more
+# likely to be cut short, so bigger requests are split and sent in parallel.
+BATCH_SIZE = 25
+WORKERS = 8
+MAX_RETRIES = 6
+# Quota errors and transient server failures; anything else is a real error.
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# Each sub-request of a split topic is set in a different domain, so the
+# parallel batches don't all come back with the same examples.
+DOMAINS = [
+    "e-commerce orders and products",
+    "employees, departments and payroll",
+    "banking accounts and transactions",
+    "hospital patients and appointments",
+    "university students, courses and grades",
+    "logistics shipments and warehouses",
+    "music streaming artists, albums and plays",
+    "real estate listings and agents",
+    "airline flights, bookings and passengers",
+    "library books, members and loans",
+    "restaurant menus, orders and reviews",
+    "sports teams, players and matches",
+]
+
+_client = None
+_client_lock = threading.Lock()
 
 class Query(BaseModel):
     instruction: str = Field(..., description="The natural language instruction for the query. Do not enclose in quotes.")
@@ -15,19 +47,54 @@ class Query(BaseModel):
     table_schema: str = Field(..., description="The schema of the table used in the query. Do not enclose in quotes.")
     explanation: str = Field(..., description="The explanation of the query. Do not enclose in quotes.")
 
+def shared_client():
+    # One client, and so one connection pool, for every generator and thread.
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client()
+        return _client
+
+def split_rows(num_rows, batch_size=BATCH_SIZE):
+    # 60 rows at 25 per request -> [20, 20, 20]: as few requests as the batch
+    # size allows, of nearly equal size so they finish together.
+    parts = max(1, -(-num_rows // batch_size))
+    return [num_rows // parts + (1 if i < num_rows % parts else 0) for i in range(parts)]
+
+def is_retryable(e):
+    return isinstance(e, errors.APIError) and e.code in RETRYABLE_CODES
+
+def retry_after(e):
+    # The delay a 429 asks for in its RetryInfo detail, e.g. "17s", if any
+    details = getattr(e, "details", None) or {}
+    error = details.get("error", details) if isinstance(details, dict) else {}
+    for detail in error.get("details", []) if isinstance(error, dict) else []:
+        if detail.get("@type", "").endswith("RetryInfo") and detail.get("retryDelay"):
+            try:
+                return float(detail["retryDelay"].rstrip("s"))
+            except ValueError:
+                return None
+    return None
+
 class Generator:
-    def __init__(self, topic):
+    def __init__(self, topic, client=None, limiter=None, max_retries=MAX_RETRIES):
         self.topic = topic
-        self.client = genai.Client()
+        self.client = client or shared_client()
+        # A shared src.ratelimit.TokenBucket, if requests should be paced
+        self.limiter = limiter
+        self.max_retries = max_retries
 
-    def generate_data(self, num_rows):
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=f"""
+    def prompt(self, num_rows, part=1, parts=1):
+        variation = ""
+        if parts > 1:
+            variation = f"""
+            This is batch {part} of {parts} for this topic. Set every example in this batch in the domain of {DOMAINS[(part - 1) % len(DOMAINS)]}.
+            """
+        return f"""
             You are a data generation model.
 
             Your task is to generate {num_rows} high-quality examples of text-to-SQL pairs for the topic: "{self.topic}".
-
+            {variation}
             Each example must include the following fields:
             - instruction: A natural language question, request, or command.
             - query: A syntactically correct **SQLite-compatible** SQL query.
@@ -39,10 +106,51 @@ class Generator:
             - Vary the complexity: include simple filters, joins, subqueries, aggregates, date operations, and edge cases.
             - Make sure table and column names are descriptive and realistic.
             - Do not return extra commentary or markdown. Return only a JSON list matching this Pydantic schema:
-            """,
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': list[Query],
-            }
-        )
+            """
+
+    def request(self, num_rows, part=1, parts=1):
+        # One generateContent call, paced by the limiter and retried with
+        # backoff on quota and server errors.
+        def call():
+            return self.client.models.generate_content(
+                model=MODEL,
+                contents=self.prompt(num_rows, part, parts),
+                config={
+                    'response_mime_type': 'application/json',
+                    'response_schema': list[Query],
+                }
+            )
+
+        response = call_with_backoff(call, is_retryable, retry_after, max_retries=self.max_retries, limiter=self.limiter)
         return json.loads(response.text)
+
+    def generate_data(self, num_rows):
+        return self.request(num_rows)
+
+def generate_batches(topics, num_rows, workers=WORKERS, limiter=None, batch_size=BATCH_SIZE, client=None, skip=None):
+    # Generates `num_rows` examples for every topic, with all topics' requests
+    # sharing one pool of `workers` threads, and yields (topic, batch, rows)
+    # as each request completes. Batches for which skip(topic, batch) is true
+    # are not requested. A request that still fails after its retries is
+    # logged and not yielded.
+    generators = {topic: Generator(topic, client, limiter) for topic in topics}
+    jobs = [
+        (topic, part, size, len(sizes))
+        for topic in topics
+        for sizes in [split_rows(num_rows, batch_size)]
+        for part, size in enumerate(sizes, 1)
+        if skip is None or not skip(topic, part)
+    ]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generate") as pool:
+        futures = {
+            pool.submit(generators[topic].request, size, part, parts): (topic, part)
+            for topic, part, size, parts in jobs
+        }
+        for future in as_completed(futures):
+            topic, part = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                logging.error(f"Batch {part} for topic '{topic}' failed: {e}")
+                continue
+            yield topic, part, rows
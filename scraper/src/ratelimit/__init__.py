@@ -0,0 +1,77 @@
+import logging
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    # Allows `rate` requests per second on average, with bursts of up to
+    # `capacity`. Shared by every worker, so together they stay under quota.
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        # Takes the tokens and returns 0 if they are there, otherwise takes
+        # nothing and returns how many seconds until they would be.
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        # Blocks until the tokens are available. Callers reserve their slot
+        # before sleeping, so they are served in the order they arrived.
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        # Holds everyone back for `seconds`, e.g. after the server says the
+        # quota is exhausted, rather than letting each worker find out alone.
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    # Exponential backoff with full jitter; attempt counts from 1.
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def call_with_backoff(fn, retryable, retry_after=None, max_retries=6, base=1.0, cap=60.0, limiter=None):
+    # Calls fn() until it succeeds, retrying errors for which retryable(e) is
+    # true. retry_after(e) may return the server's requested delay in seconds,
+    # which is honoured, and passed on to `limiter` so other callers wait too.
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not retryable(e):
+                raise
+            requested = retry_after(e) if retry_after is not None else None
+            if requested is not None and limiter is not None:
+                # The limiter makes every caller, this one included, wait it out
+                limiter.pause(requested)
+                requested = None
+            delay = max(requested or 0.0, backoff_delay(attempt, base, cap))
+            logging.warning(f"Attempt {attempt} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Checks that each example's query actually runs on its table_schema: the
+# schema is built in a fresh in-memory SQLite database and the query executed
+# there, with a time limit. Tables are empty, so what is caught is SQL that
+# doesn't parse, names tables or columns the schema doesn't have, or uses
+# functions SQLite lacks.
+
+TIMEOUT_SECONDS = 2.0
+# VM instructions between time checks
+PROGRESS_STEPS = 1000
+
+_CREATE = re.compile(r"\bcreate\s+(?:temp\w*\s+|virtual\s+)?(?:table|view|index|trigger)\b", re.I)
+# name(col type, ...) as a shorthand for a table, allowing one level of
+# nested parentheses such as DECIMAL(10, 2)
+_SHORTHAND = re.compile(r"([A-Za-z_][\w]*)\s*\(((?:[^()]|\([^()]*\))*)\)")
+
+
+class ValidationTimeout(Exception):
+    pass
+
+
+def schema_statements(schema):
+    # SQL that builds the schema. CREATE statements are used as they are;
+    # otherwise every `name(col type, ...)` is read as a table.
+    schema = (schema or "").strip()
+    if _CREATE.search(schema):
+        return schema
+    return ";\n".join(f"CREATE TABLE {name} ({columns})" for name, columns in _SHORTHAND.findall(schema))
+
+
+# What building a schema may do: create tables, indexes, views and triggers
+# in the in-memory main and temp databases, fill them, and the reads,
+# function calls, index builds and catalog updates those involve. Virtual
+# tables are not supported and fail as a schema error.
+_SCHEMA_ACTIONS = {
+    sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_CREATE_VIEW, sqlite3.SQLITE_CREATE_TRIGGER,
+    sqlite3.SQLITE_CREATE_TEMP_TABLE, sqlite3.SQLITE_CREATE_TEMP_INDEX, sqlite3.SQLITE_CREATE_TEMP_VIEW,
+    sqlite3.SQLITE_CREATE_TEMP_TRIGGER, sqlite3.SQLITE_REINDEX, sqlite3.SQLITE_INSERT,
+    sqlite3.SQLITE_READ, sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_TRANSACTION,
+}
+_CATALOGS = {"main": "sqlite_master", "temp": "sqlite_temp_master"}
+
+
+def _schema_authorizer(action, arg1, arg2, database, trigger):
+    if action == sqlite3.SQLITE_UPDATE and arg1 == _CATALOGS.get(database):
+        return sqlite3.SQLITE_OK
+    if action in _SCHEMA_ACTIONS and database in ("main", "temp", None):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def _query_authorizer(action, *args):
+    # Nothing an example runs may reach outside its in-memory database;
+    # VACUUM INTO counts as an ATTACH too
+    if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def validate_example(row, timeout=TIMEOUT_SECONDS):
+    # None if the query runs on the schema, otherwise (error_type, message)
+    # with error_type one of "empty", "schema", "query" or "timeout".
+    query = (row.get("query") or "").strip()
+    if not query:
+        return "empty", "no query"
+    statements = schema_statements(row.get("table_schema"))
+    if not statements:
+        return "schema", "no tables in table_schema"
+
+    conn = sqlite3.connect(":memory:")
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    try:
+        # The schema is as untrusted as the query, so it is checked too
+        conn.set_authorizer(_schema_authorizer)
+        try:
+            conn.executescript(statements)
+        except sqlite3.Error as e:
+            return "schema", str(e)
+        conn.set_authorizer(_query_authorizer)
+        try:
+            try:
+                conn.execute(query).fetchall()
+            except sqlite3.ProgrammingError:
+                # More than one statement, e.g. an INSERT and then a SELECT
+                conn.executescript(query)
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                return "timeout", f"query took longer than {timeout}s"
+            return "query", str(e)
+        except sqlite3.Error as e:
+            return "query", str(e)
+        return None
+    finally:
+        conn.close()
+
+
+def _check(args):
+    row, timeout = args
+    return validate_example(row, timeout)
+
+
+def validate_rows(rows, workers=None, timeout=TIMEOUT_SECONDS):
+    # validate_example() for every row across a pool of worker processes;
+    # returns the results in the order of `rows`.
+    rows = list(rows)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(rows) < 2:
+        return [validate_example(row, timeout) for row in rows]
+    chunksize = max(1, min(500, len(rows) // (workers * 8)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_check, ((row, timeout) for row in rows), chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every example's query runs on its table schema.")
+    parser.add_argument("input", help="a .csv or .jsonl file, or a .parquet directory")
+    parser.add_argument("output", help="where to write the checked examples, in any of the same formats")
+    parser.add_argument("--drop", action="store_true", help="leave failing examples out instead of tagging them")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_SECONDS, help=f"seconds a query may run (default {TIMEOUT_SECONDS})")
+    args = parser.parse_args(argv)
+
+    from src.writer import read_rows, write_rows
+    rows = list(read_rows(args.input))
+    start = time.time()
+    results = validate_rows(rows, args.workers, args.timeout)
+    elapsed = time.time() - start
+
+    failures = {}
+    for result in results:
+        if result is not None:
+            failures[result[0]] = failures.get(result[0], 0) + 1
+    fields = list(rows[0]) if rows else []
+    if args.drop:
+        write_rows(args.output, [row for row, result in zip(rows, results) if result is None], fields)
+    else:
+        tagged = [
+            {**row, "valid": result is None, "error": None if result is None else f"{result[0]}: {result[1]}"}
+            for row, result in zip(rows, results)
+        ]
+        write_rows(args.output, tagged, fields + ["valid", "error"])
+    logging.info(
+        f"{len(rows) - sum(failures.values())} of {len(rows)} examples run on their schema "
+        f"({', '.join(f'{n} {kind}' for kind, n in sorted(failures.items())) or 'no failures'}) "
+        f"in {elapsed:.1f}s on {args.workers} workers"
+    )
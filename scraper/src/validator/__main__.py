@@ -0,0 +1,5 @@
+import logging
+from src.validator import main
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(levelname)s - %(message)s')
+main()
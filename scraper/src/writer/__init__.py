@@ -0,0 +1,294 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import time
+from pydantic import ValidationError
+
+# Writes generated examples as each batch arrives, and keeps a manifest of
+# finished (topic, batch) pairs next to the output, so a restarted run picks
+# up exactly where the last one stopped.
+#
+# The manifest is a JSON-lines log: a first line with the run's settings,
+# then one line per finished batch, appended only after the batch's rows are
+# on disk. For CSV and JSONL each line records the file size at that point;
+# on resume anything past the last recorded size, i.e. rows of a batch that
+# never finished, is cut off and generated again. Parquet output is a
+# directory with one part file per batch, each renamed into place once
+# complete.
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+_SLUG = re.compile(r"[^A-Za-z0-9]+")
+
+
+def format_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported output format '{ext}', expected one of {', '.join(FORMATS)}")
+    return FORMATS[ext]
+
+
+def row_key(row):
+    # Rows with the same instruction and query, ignoring case and spacing,
+    # are the same example.
+    text = "\0".join(" ".join(str(row.get(f, "")).lower().split()) for f in ("instruction", "query"))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class _TextSink:
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self.file = open(path, "a+", newline="", encoding="utf-8")
+
+    def truncate(self, size):
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() > size:
+            logging.info(f"Discarding {self.file.tell() - size} bytes of unfinished batches from {self.path}")
+            self.file.truncate(size)
+
+    def existing(self):
+        self.file.flush()
+        with open(self.path, newline="", encoding="utf-8") as f:
+            yield from self.read(f)
+
+    def write(self, rows, name):
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(self.encode(rows, self.file.tell() == 0))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink(_TextSink):
+    # The header names columns the way model_training.ipynb reads them,
+    # e.g. table_schema as "Table Schema".
+    @staticmethod
+    def read(f):
+        for row in csv.DictReader(f):
+            yield {name.lower().replace(" ", "_"): value for name, value in row.items()}
+
+    def encode(self, rows, new_file):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if new_file:
+            writer.writerow([f.replace("_", " ").title() for f in self.fields])
+        writer.writerows([row.get(f) for f in self.fields] for row in rows)
+        return out.getvalue()
+
+
+class JsonlSink(_TextSink):
+    @staticmethod
+    def read(f):
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+    def encode(self, rows, new_file):
+        return "".join(json.dumps({f: row.get(f) for f in self.fields}, ensure_ascii=False) + "\n" for row in rows)
+
+
+class ParquetSink:
+    def __init__(self, path, fields):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install 'scraper[parquet]'") from None
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.fields = fields
+        os.makedirs(path, exist_ok=True)
+        self.parts = set()
+
+    def truncate(self, size):
+        # Part files not in the manifest belong to unfinished batches
+        for name in os.listdir(self.path):
+            if name not in self.parts:
+                os.remove(os.path.join(self.path, name))
+
+    def existing(self):
+        for name in sorted(self.parts):
+            yield from self.pq.read_table(os.path.join(self.path, name)).to_pylist()
+
+    def write(self, rows, name):
+        table = self.pa.table({f: [row.get(f) for row in rows] for f in self.fields})
+        final = os.path.join(self.path, name)
+        tmp = final + ".tmp"
+        self.pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, final)
+        self.parts.add(name)
+        return None
+
+    def close(self):
+        pass
+
+
+_SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def read_rows(path):
+    # Every row of a dataset in any of the output formats
+    format = format_for(path)
+    if format == "parquet":
+        sink = ParquetSink(path, [])
+        sink.parts = {name for name in os.listdir(path) if name.endswith(".parquet")}
+        yield from sink.existing()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from _SINKS[format].read(f)
+
+
+def write_rows(path, rows, fields=None):
+    # Writes a whole dataset at once, without a manifest
+    rows = list(rows)
+    fields = fields or (list(rows[0]) if rows else [])
+    if os.path.exists(path):
+        raise ValueError(f"{path} already exists")
+    sink = _SINKS[format_for(path)](path, fields)
+    try:
+        if rows:
+            sink.write(rows, "part-0000.parquet")
+    finally:
+        sink.close()
+
+
+class DatasetWriter:
+    def __init__(self, path, model, settings=None, manifest=None, dedup=None, check=None):
+        # `model` is the pydantic model rows are validated against; its fields
+        # are the output columns. `settings` (e.g. rows per topic and batch
+        # size) must match the manifest's for a run to be resumed, since they
+        # decide how topics are split into batches. `dedup`, a
+        # src.dedup.NearDuplicateIndex, also drops near-duplicates, and rows
+        # for which `check(row)`, e.g. src.validator.validate_example, returns
+        # an error are dropped too.
+        self.path = path
+        self.model = model
+        self.fields = list(model.model_fields)
+        self.format = format_for(path)
+        self.settings = settings or {}
+        self.manifest_path = manifest or f"{path}.manifest.jsonl"
+        self.completed = {}
+        self.seen = set()
+        self.written = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self.failed = 0
+        self.dedup = dedup
+        self.check = check
+
+        if not os.path.exists(self.manifest_path) and os.path.exists(path) and (os.path.isdir(path) or os.path.getsize(path)):
+            raise ValueError(f"{path} already exists but has no manifest to resume from; choose a new output path")
+        entries = self._read_manifest()
+        self.sink = _SINKS[self.format](path, self.fields)
+        size = 0
+        for entry in entries:
+            self.completed[(entry["topic"], entry["batch"])] = entry["rows"]
+            if entry.get("part"):
+                self.sink.parts.add(entry["part"])
+            size = entry.get("size", size)
+        self.sink.truncate(size)
+        existing = list(self.sink.existing())
+        self.seen.update(row_key(row) for row in existing)
+        if dedup is not None:
+            dedup.add_many(existing)
+        self.manifest = open(self.manifest_path, "a", encoding="utf-8")
+        if not entries and os.path.getsize(self.manifest_path) == 0:
+            self._log({"settings": self.settings, "format": self.format, "started_at": time.time()})
+        if self.completed:
+            logging.info(f"Resuming {path}: {len(self.completed)} batches and {len(self.seen)} rows already written")
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return []
+        entries = []
+        good = 0
+        with open(self.manifest_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; everything before it stands
+                    break
+                good += len(line)
+                if "settings" in entry:
+                    if entry["settings"] != self.settings:
+                        raise ValueError(
+                            f"{self.manifest_path} was written with {entry['settings']}, not {self.settings}; "
+                            "use the same settings to resume, or a new output path"
+                        )
+                else:
+                    entries.append(entry)
+        with open(self.manifest_path, "r+b") as f:
+            f.truncate(good)
+        return entries
+
+    def _log(self, entry):
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+
+    def is_done(self, topic, batch):
+        return (topic, batch) in self.completed
+
+    def write_batch(self, topic, batch, rows):
+        # Validates and de-duplicates one batch, writes it, then records it in
+        # the manifest. Returns the number of rows written.
+        kept = []
+        for row in rows:
+            try:
+                row = self.model.model_validate(row).model_dump()
+            except ValidationError as e:
+                self.rejected += 1
+                logging.warning(f"Dropping invalid row for topic '{topic}': {e.errors()[0]['msg']}")
+                continue
+            if self.check is not None:
+                error = self.check(row)
+                if error is not None:
+                    self.failed += 1
+                    logging.warning(f"Dropping example for topic '{topic}' that doesn't run: {error[1]}")
+                    continue
+            key = row_key(row)
+            if key in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(key)
+            kept.append(row)
+        if self.dedup is not None and kept:
+            flags = self.dedup.add_many(kept)
+            self.near_duplicates += flags.count(False)
+            kept = [row for row, keep in zip(kept, flags) if keep]
+
+        entry = {"topic": topic, "batch": batch, "rows": len(kept)}
+        if kept:
+            part = f"{_SLUG.sub('-', topic).strip('-').lower()}-{batch:04d}.parquet"
+            size = self.sink.write(kept, part)
+            if size is not None:
+                entry["size"] = size
+            else:
+                entry["part"] = part
+        self._log(entry)
+        self.completed[(topic, batch)] = len(kept)
+        self.written += len(kept)
+        return len(kept)
+
+    def close(self):
+        self.sink.close()
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+from google import genai
+from google.genai import errors
+
+from src import ratelimit
+from src.fake_gemini import FakeGemini, start_server
+from src.generator import Generator, Query, generate_batches
+from src.ratelimit import TokenBucket
+
+
+class FlakyGemini(FakeGemini):
+    # Answers the first `failures` requests with a 503
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def admit(self):
+        rejected = super().admit()
+        if rejected is None and self.requests <= self.failures:
+            return 503, {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}
+        return rejected
+
+
+@contextmanager
+def serve(fake):
+    # A client talking to `fake` on a free local port
+    server = start_server(fake, port=0)
+    host, port = server.server_address
+    try:
+        yield genai.Client(api_key="fake", http_options={"base_url": f"http://{host}:{port}"})
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # Retries go straight away unless the server asked for a delay
+    monkeypatch.setattr(ratelimit, "backoff_delay", lambda *args, **kwargs: 0.0)
+
+
+def test_request_returns_rows():
+    fake = FakeGemini(latency_ms=0, row_ms=0, rpm=0)
+    with serve(fake) as client:
+        rows = Generator("joins", client=client).request(3)
+    assert len(rows) == 3
+    assert all(Query.model_validate(row) for row in rows)
+    assert fake.requests == 1
+
+
+def test_429_waits_for_retry_delay(no_backoff):
+    # One request per second: the second is throttled with a RetryInfo delay
+    # of about a second, which the limiter makes the retry wait out.
+    fake = FakeGemini(latency_ms=0, row_ms=0, rpm=60)
+    with serve(fake) as client:
+        generator = Generator("joins", client=client, limiter=TokenBucket(100))
+        generator.request(1)
+        start = time.monotonic()
+        rows = generator.request(1)
+        elapsed = time.monotonic() - start
+    assert len(rows) == 1
+    assert fake.throttled == 1
+    assert fake.requests == 3
+    assert elapsed >= 0.8
+
+
+def test_503_is_retried(no_backoff):
+    fake = FlakyGemini(2, latency_ms=0, row_ms=0, rpm=0)
+    with serve(fake) as client:
+        rows = Generator("joins", client=client).request(2)
+    assert len(rows) == 2
+    assert fake.requests == 3
+
+
+def test_gives_up_after_max_retries(no_backoff):
+    fake = FakeGemini(latency_ms=0, row_ms=0, rpm=0, error_rate=1.0)
+    with serve(fake) as client:
+        with pytest.raises(errors.APIError) as raised:
+            Generator("joins", client=client, max_retries=2).request(1)
+    assert raised.value.code == 503
+    assert fake.requests == 3
+
+
+def test_limiter_keeps_workers_under_quota():
+    # Six batches from four workers, paced at five requests a second against
+    # a quota of ten: none of them should be throttled.
+    fake = FakeGemini(latency_ms=0, row_ms=0, rpm=600)
+    limiter = TokenBucket(5, capacity=1)
+    with serve(fake) as client:
+        start = time.monotonic()
+        batches = list(generate_batches(["joins", "dates"], 6, workers=4, limiter=limiter, batch_size=2, client=client))
+        elapsed = time.monotonic() - start
+    assert sorted((topic, part) for topic, part, _ in batches) == [(t, p) for t in ("dates", "joins") for p in (1, 2, 3)]
+    assert all(len(rows) == 2 for _, _, rows in batches)
+    assert fake.throttled == 0
+    assert elapsed >= 0.9
+
+
+def test_token_bucket_paces_bursts():
+    bucket = TokenBucket(20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.18
+    assert bucket.try_acquire() > 0
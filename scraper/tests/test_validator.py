@@ -0,0 +1,32 @@
+import os
+
+from src.validator import validate_example
+
+
+def check(schema, query):
+    return validate_example({"table_schema": schema, "query": query})
+
+
+def test_view_in_schema():
+    assert check("CREATE TABLE t(a); CREATE VIEW v AS SELECT a FROM t", "SELECT a FROM v") is None
+
+
+def test_trigger_in_schema():
+    schema = "CREATE TABLE t(a); CREATE TABLE log(a); CREATE TRIGGER tr AFTER INSERT ON t BEGIN INSERT INTO log VALUES (new.a); END"
+    assert check(schema, "INSERT INTO t VALUES (1); SELECT a FROM log") is None
+
+
+def test_shorthand_schema():
+    assert check("employees(id INTEGER, salary DECIMAL(10, 2))", "SELECT avg(salary) FROM employees") is None
+
+
+def test_missing_column():
+    assert check("CREATE TABLE t(a)", "SELECT b FROM t")[0] == "query"
+
+
+def test_attach_is_denied(tmp_path):
+    target = tmp_path / "out.db"
+    assert check(f"CREATE TABLE t(a); ATTACH '{target}' AS x", "SELECT a FROM t")[0] == "schema"
+    assert check("CREATE TABLE t(a)", f"ATTACH '{target}' AS x")[0] == "query"
+    assert check("CREATE TABLE t(a)", f"VACUUM INTO '{target}'")[0] == "query"
+    assert not os.path.exists(target)
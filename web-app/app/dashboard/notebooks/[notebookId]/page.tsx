@@ -18,7 +18,7 @@ import {
 	SidebarProvider,
 	SidebarTrigger,
 } from "@/components/ui/sidebar"
-import { useState } from "react"
+import { useRef, useState } from "react"
 import { useParams } from "next/navigation"
 import {
 	Dialog,
@@ -38,16 +38,63 @@ export default function NotebookPage() {
 		rows: any[]
 		sql: string
 		success: boolean
+		next_page_token?: string | null
 	}
 
-	const [queries, setQueries] = useState<{ query: string; reply: QueryReply }[]>(
+	// New queries go on the front of the list, so entries are addressed by
+	// id rather than by their position
+	const [queries, setQueries] = useState<{ id: number; query: string; reply: QueryReply }[]>(
 		[]
 	)
+	const nextId = useRef(0)
 
 	const handleNewQuery = (query: string, reply: string) => {
 		const parsedReply =
 			typeof reply === "string" ? JSON.parse(reply) : reply
-		setQueries((prev) => [{ query, reply: parsedReply }, ...prev])
+		const id = nextId.current++
+		setQueries((prev) => [{ id, query, reply: parsedReply }, ...prev])
+	}
+
+	const [loadingMore, setLoadingMore] = useState<number | null>(null)
+
+	const loadMoreRows = async (id: number) => {
+		const token = queries.find((q) => q.id === id)?.reply.next_page_token
+		if (!token) return
+
+		setLoadingMore(id)
+		try {
+			const res = await fetch("http://localhost:5000/query", {
+				method: "POST",
+				headers: {
+					"Content-Type": "application/json",
+				},
+				body: JSON.stringify({ page_token: token }),
+			})
+			if (!res.ok) {
+				throw new Error(`HTTP error: ${res.status}`)
+			}
+
+			const page = await res.json()
+			setQueries((prev) =>
+				prev.map((q) =>
+					q.id === id
+						? {
+							...q,
+							reply: {
+								...q.reply,
+								// Each page repeats the column names as its first row
+								rows: [...q.reply.rows, ...(page.rows || []).slice(1)],
+								next_page_token: page.next_page_token,
+							},
+						}
+						: q
+				)
+			)
+		} catch (err) {
+			console.error("Error loading more rows:", err)
+		} finally {
+			setLoadingMore(null)
+		}
 	}
 
 	return (
@@ -106,9 +153,9 @@ export default function NotebookPage() {
 
 					{/* Scrollable queries list */}
 					<motion.div layout className="flex-1 flex flex-col-reverse overflow-y-auto gap-4 mt-5">
-						{queries.map((q, index) => (
+						{queries.map((q) => (
 							<motion.div
-								key={index}
+								key={q.id}
 								className="p-4 border rounded-lg bg-card shadow-sm hover:shadow-md transition-shadow"
 							>
 								{/* Header with query and status */}
@@ -178,6 +225,16 @@ export default function NotebookPage() {
 													))}
 											</tbody>
 										</table>
+										{q.reply.next_page_token && (
+											<Button
+												variant="outline"
+												className="mt-3"
+												disabled={loadingMore === q.id}
+												onClick={() => loadMoreRows(q.id)}
+											>
+												{loadingMore === q.id ? "Loading..." : "Load more rows"}
+											</Button>
+										)}
 									</div>
 								)}
 							</motion.div>
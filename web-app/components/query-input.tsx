@@ -10,6 +10,9 @@ import {
 	TableRow,
 } from "@/components/ui/table"
 
+// Rows in the first page; the rest are fetched with next_page_token on demand
+export const PAGE_SIZE = 100
+
 export default function QueryInput({ onSubmit }) {
 	const id = useId()
 	const [query, setQuery] = useState("")
@@ -29,7 +32,7 @@ export default function QueryInput({ onSubmit }) {
 				headers: {
 					"Content-Type": "application/json",
 				},
-				body: JSON.stringify({ nl_query: query }),
+				body: JSON.stringify({ nl_query: query, page_size: PAGE_SIZE }),
 			})
 
 			if (!res.ok) {